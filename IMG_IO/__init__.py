@@ -3,7 +3,12 @@
 """
 
 # standard libraries
+import collections
 import gettext
+import logging
+import os
+import threading
+import time
 import warnings
 
 # third party libraries
@@ -18,6 +23,9 @@ with warnings.catch_warnings():
 
 _ = gettext.gettext
 
+# header contents and per-stage import timings are logged with level DEBUG
+logger = logging.getLogger(__name__)
+
 
 class IMGIODelegate(object):
 
@@ -26,20 +34,85 @@ class IMGIODelegate(object):
         self.io_handler_id = "img-io-handler"
         self.io_handler_name = _("QSTEM")
         self.io_handler_extensions = ["img"]
+        # how complex exit waves are imported: "complex" imports the wave itself, "amplitude", "phase" or
+        # "intensity" import the respective view of the wave.
+        self.complex_import_mode = "complex"
+        # number of exit waves that are kept in memory so that further views of them are not computed again
+        self.exit_wave_cache_size = 2
+        self.__exit_waves = collections.OrderedDict()
+        self.__exit_waves_lock = threading.Lock()
+        # optional callable that gets the file path and a dictionary with the time in seconds spent in each import
+        # stage ('header', 'payload', 'calibration' and 'total') after each import
+        self.timing_callback = None
+
+    def __read_img(self, file_path, timings):
+        # complex waves are cached together with their header so that opening another view of the same file needs
+        # neither reading the file again nor recomputing views that were already opened
+        if self.complex_import_mode == "complex":
+            return convert_img.read_img(file_path, timings=timings)
+        stat = os.stat(file_path)
+        key = (os.path.realpath(file_path), stat.st_size, stat.st_mtime)
+        # the file is read without holding the lock, so that imports of different files can run concurrently
+        with self.__exit_waves_lock:
+            entry = self.__exit_waves.get(key)
+            if entry is not None:
+                self.__exit_waves.move_to_end(key)
+        if entry is None:
+            data, integers, doubles, comment = convert_img.read_img(file_path, timings=timings)
+            if not integers['is_complex']:
+                return data, integers, doubles, comment
+            with self.__exit_waves_lock:
+                # if another import of the same file finished first, use its wave so that the views are shared
+                entry = self.__exit_waves.setdefault(key, (convert_img.ExitWave(data), integers, doubles, comment))
+                self.__exit_waves.move_to_end(key)
+                while len(self.__exit_waves) > self.exit_wave_cache_size:
+                    self.__exit_waves.popitem(last=False)
+        exit_wave, integers, doubles, comment = entry
+        return exit_wave.get_view(self.complex_import_mode), integers, dict(doubles), comment
 
     def read_data_and_metadata(self, extension, file_path):
-        data, integers, doubles, comment = convert_img.read_img(file_path)
+        timings = {}
+        start = time.perf_counter()
+        data, integers, doubles, comment = self.__read_img(file_path, timings)
+        calibration_start = time.perf_counter()
         doubles.pop('aux_data')
-        print(integers)
-        print(doubles)
-        print(comment)
         dimensional_calibrations = [self.__api.create_calibration(offset=0.0, scale=doubles['dy']/10.0, units='nm'),
                                     self.__api.create_calibration(offset=0.0, scale=doubles['dx']/10.0, units='nm')]
-        return self.__api.create_data_and_metadata(data, dimensional_calibrations=dimensional_calibrations)
+        data_and_metadata = self.__api.create_data_and_metadata(data, dimensional_calibrations=dimensional_calibrations)
+        end = time.perf_counter()
+        timings['calibration'] = end - calibration_start
+        timings['total'] = end - start
+        self.__report(file_path, integers, doubles, comment, timings)
+        return data_and_metadata
+
+    def __report(self, file_path, integers, doubles, comment, timings):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Header of %s: %s %s %s', file_path, integers, doubles, comment)
+            logger.debug('Imported %s in %.3f ms (%s)', file_path, timings['total']*1e3,
+                         ', '.join('{}: {:.3f} ms'.format(stage, timings[stage]*1e3)
+                                   for stage in ('header', 'payload', 'calibration') if stage in timings))
+        if callable(self.timing_callback):
+            self.timing_callback(file_path, timings)
 
     def can_write_data_and_metadata(self, data_and_metadata, extension):
-        return False
-        
+        # img files hold exactly one (real or complex) 2d image, sequences are written as one file per frame
+        if data_and_metadata.is_data_rgb or data_and_metadata.is_data_rgba:
+            return False
+        return (data_and_metadata.collection_dimension_count == 0 and
+                data_and_metadata.datum_dimension_count == 2 and
+                len(data_and_metadata.data_shape) == 2 + int(data_and_metadata.is_sequence))
+
+    def write_data_and_metadata(self, data_and_metadata, file_path, extension):
+        data = data_and_metadata.data
+        calibrations = data_and_metadata.dimensional_calibrations
+        # calibrations in Swift are in nm, qstem uses angstrom
+        doubles = {'t': 0.0, 'dx': calibrations[-1].scale*10.0, 'dy': calibrations[-2].scale*10.0}
+        if data_and_metadata.is_sequence:
+            convert_img.write_img_sequence(data, file_path, doubles=doubles)
+        else:
+            convert_img.write_img(data, file_path, doubles=doubles)
+
+
 
 class IMGIOExtension(object):
 
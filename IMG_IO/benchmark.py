@@ -0,0 +1,55 @@
+"""
+    Startup-time benchmark for the IMG_IO extension.
+
+    Loading the extension should only cost importing IMG_IO and convert_img, the optional backends (PIL, h5py and
+    tifffile) must not be imported before they are needed. Run with "python -m IMG_IO.benchmark [max_ms]" from the
+    directory that contains the extension packages.
+
+"""
+
+# standard libraries
+import json
+import os
+import subprocess
+import sys
+
+# third party libraries
+# None
+
+# local libraries
+# None
+
+
+lazy_modules = ('PIL', 'h5py', 'TIFF_IO_MD')
+
+# numpy is already loaded when Swift loads its extensions, so it is imported before the timing starts
+_startup_script = """
+import json, sys, time
+import numpy
+start = time.perf_counter()
+import IMG_IO
+duration = time.perf_counter() - start
+print(json.dumps({'duration': duration, 'loaded': [name for name in %r if name in sys.modules]}))
+""" % (lazy_modules,)
+
+
+def benchmark_startup(repeat=5, max_duration=None):
+    # imports IMG_IO in fresh interpreters and returns the fastest import time in seconds. Raises a RuntimeError if
+    # an optional backend was imported during extension loading or if the import took longer than max_duration.
+    extensions_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    durations = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _startup_script], cwd=extensions_path)
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        if result['loaded']:
+            raise RuntimeError('Loading IMG_IO imported optional backends: {}'.format(', '.join(result['loaded'])))
+        durations.append(result['duration'])
+    duration = min(durations)
+    if max_duration is not None and duration > max_duration:
+        raise RuntimeError('Loading IMG_IO took {:.1f} ms (limit {:.1f} ms).'.format(duration*1e3, max_duration*1e3))
+    return duration
+
+
+if __name__ == '__main__':
+    max_duration = float(sys.argv[1])*1e-3 if len(sys.argv) > 1 else None
+    print('Loading IMG_IO took {:.1f} ms.'.format(benchmark_startup(max_duration=max_duration)*1e3))
@@ -5,26 +5,39 @@ Created on Tue Oct  6 14:00:54 2015
 @author: mittelberger
 """
 
-_has_PIL = False
-try:
-    from PIL import Image
-except ImportError:
-    pass
-else:
-    _has_PIL = True
-    
 import numpy as np
 import os
-
-_has_h5py = False
-try:
-    import h5py
-except ImportError:
-    pass
-else:
-    _has_h5py = True
-    
+import concurrent.futures
+import importlib
+import threading
+import warnings
 import struct
+import functools
+import time
+
+# optional backends (PIL, h5py, tifffile) are only imported on first use to keep importing this module (and thereby
+# loading the IMG_IO extension) fast
+_optional_modules = {}
+
+def _load_optional(name):
+    # returns the module or None if it is not installed
+    if name not in _optional_modules:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+def _has_PIL():
+    return _load_optional('PIL.Image') is not None
+
+def _has_h5py():
+    return _load_optional('h5py') is not None
+
+def _has_tifffile():
+    return _load_optional('TIFF_IO_MD.tifffile') is not None
 
 ####################################################################################################
 ####################################################################################################
@@ -38,6 +51,8 @@ shape_map = (512,512) # number of pixels in map in y, x
 basename = 'diffAvg'
 separator = '_'
 save_as_hdf5 = False
+save_as_stack = False # write the whole map into one tiff file instead of one tiff file per frame
+save_as_imagej = False # if saving as stack, write an ImageJ hyperstack instead of a BigTIFF file
 save_metadata = False
 ####################################################################################################
 ####################################################################################################
@@ -46,7 +61,9 @@ save_metadata = False
 integer_names = ['header_size', 'param_size', 'comment_size', 'Nx', 'Ny', 'is_complex', 'data_size', 'version']
 double_names = ['t', 'dx', 'dy', 'aux_data']
 
-def read_img(name, path=None):
+def read_img(name, path=None, timings=None):
+    # if a dictionary is passed as timings, the time in seconds spent for parsing the header and for reading the
+    # payload is stored in it (keys 'header' and 'payload')
     integers = {}
     doubles = {}
     comment = ''
@@ -54,7 +71,8 @@ def read_img(name, path=None):
         filename = os.path.join(path, name)
     else:
         filename = name
-        
+
+    start = time.perf_counter()
     with open(filename, mode='rb', buffering=1) as raw:
         for entry in integer_names:
             integers[entry] = struct.unpack('<i', raw.read(4))[0]
@@ -64,30 +82,189 @@ def read_img(name, path=None):
             else:
                 doubles[entry] = struct.unpack('<d', raw.read(8))[0]
         comment = struct.unpack('<' + str(integers['comment_size']) + 's', raw.read(integers['comment_size']))
-        
+
         numbertype = 'complex' + str(integers['data_size']*8) if integers['is_complex'] \
                      else 'float' + str(integers['data_size']*8)
-        
+        header_done = time.perf_counter()
+
         data = np.fromfile(raw, dtype=numbertype).reshape((integers['Ny'], integers['Nx']), order='F')
-        
+
+    if timings is not None:
+        timings['header'] = header_done - start
+        timings['payload'] = time.perf_counter() - header_done
+
     return (np.flipud(data), integers, doubles, comment)
 
+class ExitWave(object):
+    # complex exit wave with lazily computed amplitude, phase and intensity views. each view is computed on first
+    # access only and then cached, so that opening several views of the same wave needs only one pass per view.
+    view_names = ('amplitude', 'phase', 'intensity')
+
+    def __init__(self, data):
+        self.data = data
+        self.__views = {}
+        self.__lock = threading.Lock()
+
+    def __get_view(self, name, function):
+        with self.__lock:
+            view = self.__views.get(name)
+            if view is None:
+                view = function()
+                view.setflags(write=False)
+                self.__views[name] = view
+        return view
+
+    @property
+    def amplitude(self):
+        return self.__get_view('amplitude', lambda: np.abs(self.data))
+
+    @property
+    def phase(self):
+        return self.__get_view('phase', lambda: np.angle(self.data))
+
+    @property
+    def intensity(self):
+        # always computed from the wave itself, so that the result does not depend on which views were opened before
+        return self.__get_view('intensity', lambda: np.square(self.data.real) + np.square(self.data.imag))
+
+    def get_view(self, name):
+        if name not in self.view_names:
+            raise ValueError('Unknown view {}. Must be one of {}.'.format(name, self.view_names))
+        return getattr(self, name)
+
+def _fortran_chunks(data, dtype, chunk_size=2**24):
+    # yields the payload in file order (Fortran order of the flipped frame) as buffers that can be written directly.
+    # a frame that is already Fortran contiguous (e.g. as returned by read_img) is passed on without any copy,
+    # otherwise blocks of columns are reordered so that never more than chunk_size bytes are buffered.
+    data = np.flipud(data)
+    if data.dtype == dtype and data.flags.f_contiguous:
+        yield data.T
+        return
+    columns = max(1, chunk_size // max(1, data.shape[0] * dtype.itemsize))
+    for start in range(0, data.shape[1], columns):
+        yield np.ascontiguousarray(data[:, start:start+columns].T, dtype=dtype)
+
+def write_img(data, name, path=None, doubles=None, comment=b'', version=1):
+    data = np.asanyarray(data)
+    if data.ndim != 2:
+        raise ValueError('Can only write 2D data to img files, got data with shape {}.'.format(data.shape))
+    if data.dtype.kind == 'c':
+        dtype = np.dtype('<c16') if data.dtype.itemsize > 8 else np.dtype('<c8')
+    elif data.dtype.kind == 'f' and data.dtype.itemsize == 8:
+        dtype = np.dtype('<f8')
+    else:
+        dtype = np.dtype('<f4')
+    doubles = dict(doubles) if doubles is not None else {}
+    aux_data = tuple(doubles.get('aux_data', ()))
+    if isinstance(comment, str):
+        comment = comment.encode('utf-8')
+    if path is not None:
+        filename = os.path.join(path, name)
+    else:
+        filename = name
+
+    integers = {'header_size': 56, 'param_size': len(aux_data), 'comment_size': len(comment), 'Nx': data.shape[1],
+                'Ny': data.shape[0], 'is_complex': int(dtype.kind == 'c'), 'data_size': dtype.itemsize,
+                'version': version}
+
+    with open(filename, mode='wb') as raw:
+        raw.write(struct.pack('<' + str(len(integer_names)) + 'i', *[integers[entry] for entry in integer_names]))
+        raw.write(struct.pack('<3d', doubles.get('t', 0.0), doubles.get('dx', 1.0), doubles.get('dy', 1.0)))
+        raw.write(struct.pack('<' + str(len(aux_data)) + 'd', *aux_data))
+        raw.write(comment)
+        for chunk in _fortran_chunks(data, dtype):
+            raw.write(chunk)
+
+    return filename
+
+def write_img_sequence(data, name, path=None, doubles=None, comment=b'', max_workers=None):
+    # writes one file per frame, named <name>_<frame number>.img. The frames are written in parallel.
+    basename, extension = os.path.splitext(name)
+    number_format = '{:0' + str(len(str(max(len(data) - 1, 0)))) + 'd}'
+    names = [basename + separator + number_format.format(i) + (extension or '.img') for i in range(len(data))]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(write_img, data[i], names[i], path=path, doubles=doubles, comment=comment)
+                   for i in range(len(data))]
+        return [future.result() for future in futures]
+
 def save_file_in_hdf5(data, name, h5dataset):
     name = os.path.splitext(name)[0].split(separator)
     number = int(name[2]) + shape_map[1]*int(name[1])
     h5dataset[number] = data
 
-def save_file_as_tiff(data, name, savepath):    
+@functools.lru_cache()
+def _map_index_format(shape_map):
+    return '{:0' + str(len(str(np.prod(np.array(shape_map))))) + 'd}'
+
+def map_index(name):
     name = os.path.splitext(name)[0].split(separator)
-    savename = name[0] + separator + ('{:0' + str(len(str(np.prod(np.array(shape_map))))) + 'd}').format(int(name[1]) +
-               shape_map[1]*(shape_map[0] - int(name[2]) - 1)) + separator + name[1] + separator + name[2] + '.tif'
+    return int(name[1]) + shape_map[1]*(shape_map[0] - int(name[2]) - 1)
+
+def save_file_as_tiff(data, name, savepath):
+    split_name = os.path.splitext(name)[0].split(separator)
+    savename = (split_name[0] + separator + _map_index_format(shape_map).format(map_index(name)) + separator +
+                split_name[1] + separator + split_name[2] + '.tif')
 
     complete_savepath = os.path.join(savepath, savename)
     # create output
-    image = Image.fromarray(data)
+    image = _load_optional('PIL.Image').fromarray(data)
     # save file
     image.save(complete_savepath)
 
+class TiffMapWriter(object):
+    # writes all frames of a map into one BigTIFF file (or ImageJ hyperstack). Frames have to be appended in order of
+    # their map index (see map_index), they are then written contiguously after the first page. Missing frames are
+    # filled with zeros.
+    def __init__(self, filename, imagej=False):
+        self.filename = filename
+        self.imagej = imagej
+        self.__tif = None
+        self.__next_index = 0
+        self.__zeros = None
+
+    def __save(self, data):
+        if self.__tif is None:
+            tifffile = _load_optional('TIFF_IO_MD.tifffile')
+            if tifffile is None:
+                raise RuntimeError('Cannot write tiff stacks because tifffile could not be imported.')
+            self.__tif = tifffile.TiffWriter(self.filename, bigtiff=not self.imagej, imagej=self.imagej,
+                                             software='convert_img')
+            self.__tif.save(data, metadata={'map_shape': tuple(shape_map)})
+        else:
+            self.__tif.save(data)
+        self.__next_index += 1
+
+    def append(self, data, name):
+        index = map_index(name)
+        if index < self.__next_index:
+            raise ValueError('Frames have to be appended in order. Got frame {:d} after frame {:d}.'.format(
+                             index, self.__next_index - 1))
+        if self.imagej:
+            if data.dtype.kind == 'c':
+                raise ValueError('ImageJ does not support complex data.')
+            if data.dtype not in (np.float32, np.uint8, np.uint16):
+                data = data.astype(np.float32)
+            # store the map positions as slices of the hyperstack
+            data = data.reshape((1,) + data.shape)
+        if self.__zeros is None:
+            self.__zeros = np.zeros(data.shape, dtype=data.dtype)
+        while self.__next_index < index:
+            self.__save(self.__zeros)
+        self.__save(data)
+
+    def close(self):
+        if self.__tif is not None:
+            while self.__next_index < np.prod(shape_map):
+                self.__save(self.__zeros)
+            self.__tif.close()
+            self.__tif = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 if __name__ == '__main__':
     path = os.path.normpath(path)
     dirlist = os.listdir(path)
@@ -112,18 +289,23 @@ if __name__ == '__main__':
             logfile.write(entry + '\t')
         logfile.write('comment\n')
     
-    if save_as_hdf5 and not _has_h5py:
+    if save_as_hdf5 and not _has_h5py():
         print('Cannot save data in a h5py file because h5py is not installed. Will try to save as tiff files instead.')
         save_as_hdf5 = False
     
-    if not save_as_hdf5 and not _has_PIL:
-        if _has_h5py:
+    if not save_as_hdf5 and save_as_stack and not _has_tifffile():
+        print('Cannot save data as tiff stack because tifffile could not be imported. Will save single files instead.')
+        save_as_stack = False
+
+    if not save_as_hdf5 and not save_as_stack and not _has_PIL():
+        if _has_h5py():
             print('Cannot save data as tiff files because PIL is not installed. Will try to save in hdf5 file instead.')
         else:
             raise RuntimeError('Cannot save output data because neither PIL nor h5py is installed on your system. ' +
                                'Please install at least one of these modules to use image converter.')
         
     if save_as_hdf5:
+        h5py = _load_optional('h5py')
         h5file = h5py.File(os.path.normpath(path)+'_h5.hdf5')
         data, integers, doubles, comment = read_img(matched_dirlist[counter], path=path)
         counter += 1
@@ -137,7 +319,12 @@ if __name__ == '__main__':
                 logfile.write(str(doubles[entry]) + '\t')
             logfile.write(comment + '\n')
         
-    print_interval = int(len(matched_dirlist)/100)
+    if not save_as_hdf5 and save_as_stack:
+        # frames are appended to the stack in map order
+        matched_dirlist.sort(key=map_index)
+        tiff_map_writer = TiffMapWriter(os.path.normpath(path) + '.tif', imagej=save_as_imagej)
+
+    print_interval = max(int(len(matched_dirlist)/100), 1)
     
     print('Starting to convert {:,} files...'.format(len(matched_dirlist)))
     while counter < len(matched_dirlist):
@@ -154,6 +341,8 @@ if __name__ == '__main__':
             logfile.write(str(comment) + '\n')
         if save_as_hdf5:
             save_file_in_hdf5(data, matched_dirlist[counter], h5dataset)
+        elif save_as_stack:
+            tiff_map_writer.append(data, matched_dirlist[counter])
         else:
             save_file_as_tiff(data, matched_dirlist[counter], savepath)
         counter +=1 
@@ -161,5 +350,7 @@ if __name__ == '__main__':
     
     if save_as_hdf5:
         h5file.close()
+    elif save_as_stack:
+        tiff_map_writer.close()
     if save_metadata:
         logfile.close()
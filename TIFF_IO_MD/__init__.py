@@ -11,6 +11,7 @@
 
 # standard libraries
 import gettext
+import os
 import warnings
 import logging
 
@@ -36,6 +37,25 @@ class TIFFIODelegate(object):
         self.io_handler_id = "tiff-io-handler"
         self.io_handler_name = _("TIFF Files")
         self.io_handler_extensions = ["tif", "tiff"]
+        # memory-map the data instead of reading it into memory: True or False to always or never use memory-mapping,
+        # None to memory-map data larger than memmap_threshold (in bytes). Memory-mapped data is read-only and pages
+        # are only read from disk when they are accessed. Data that is not stored contiguously in the file is decoded
+        # into a temporary file instead.
+        self.memmap_import = None
+        self.memmap_threshold = 2**30
+        # compression of exported files: None for uncompressed files, "deflate", "lzma" or "zstd" (requires the
+        # zstandard or imagecodecs package). ImageJ can only read deflate compressed files, so other files are written
+        # as plain TIFF. Zstandard reads almost as fast as uncompressed data. Image data are compressed in strips in
+        # parallel after applying a horizontal differencing predictor (byte-wise for float data). The level is used
+        # for deflate (0 to 9) and zstd (1 to 22).
+        self.export_compression = None
+        self.export_compression_level = 6
+        # tile length and width (a multiple of 16) used to export images larger than the tile size in x or y, e.g. big
+        # stitched maps, or None to write strips. ImageJ cannot read tiled files, so they are written as plain TIFF.
+        self.export_tile_size = None
+        # directory where the page offsets and tags of imported files are cached, or None to not cache them. Files
+        # with many pages that are opened repeatedly are then opened without reading all image file directories.
+        self.index_cache_directory = None
 
     def read_data_and_metadata(self, extension, file_path):
         x_resolution = y_resolution = unit = x_offset = y_offset = None
@@ -45,11 +65,10 @@ class TIFFIODelegate(object):
         # Imagej axes names
         images = channels = slices = frames = None #samples = None
 
-        with tifffile.TiffFile(file_path) as tiffimage:
-# TODO: Check whether support for multiple tif pages is necessary (for imagej compatible tifs it isn't)
-# Non-imagej compatible tifs are written (by tifffile.py) into multiple pages if they have more than 2 dimensions
-# There is also a 'shape' attribute that describes the original shape for those files. This information could be used
-# to properly load these files as well. However, right now, only the fist page will be loaded and imported
+        with tifffile.TiffFile(file_path, indexcache=self.index_cache_directory) as tiffimage:
+            # Tags and metadata are read from the first page, data from the first series. Non-imagej compatible tifs
+            # are written (by tifffile.py) into multiple pages if they have more than 2 dimensions. The series is
+            # shaped according to the 'shape' in the image description of those files.
             tiffpage = tiffimage.pages[0]
             # Try if image is imagej type
             if tiffimage.is_imagej:
@@ -90,7 +109,7 @@ class TIFFIODelegate(object):
                                               metadata_dict.get('datum_dimension_count', 1) +
                                               int(metadata_dict.get('is_sequence', False)))
                                               
-            data = tiffpage.asarray()
+            data = self.read_first_series(tiffimage)
             
             # check and adapt for rgb(a) data
             # last data axis depends on whether data is rgb(a)
@@ -109,6 +128,12 @@ class TIFFIODelegate(object):
                 # Swift only supports 8-bit color images
                 data = data.astype(numpy.uint8)
                 
+            # series shapes of non-imagej files contain all axes of the 6d shape that swift uses for export, so
+            # remove length 1 axes if this makes the number of dimensions match the swift metadata
+            if (expected_number_dimensions is not None and expected_number_dimensions != len(data.shape) and
+                len([n for n in data.shape if n > 1]) == expected_number_dimensions):
+                data = data.reshape(tuple(n for n in data.shape if n > 1))
+
             # if number of axis in swift metadata is wrong or it could not be determined and imagej metadata is there
             # use this information to reshape array
             if (expected_number_dimensions is None or
@@ -252,6 +277,23 @@ class TIFFIODelegate(object):
                                                                 metadata, timestamp, data_descriptor)
         return data_and_metadata
 
+    def read_first_series(self, tiffimage):
+        # Read all pages of the first series at once. tifffile uses a single read (or memory-map) for contiguous series.
+        # Fall back to the first page if the pages cannot be combined into a series.
+        if tiffimage.series:
+            series = tiffimage.series[0]
+            try:
+                return tiffimage.asarray(series=0, memmap=self.use_memmap(series.shape, series.dtype))
+            except ValueError as detail:
+                logging.warn('Could not read first series, reading only the first page. Reason: ' + str(detail))
+        tiffpage = tiffimage.pages[0]
+        return tiffpage.asarray(memmap=self.use_memmap(tiffpage.shape, tiffpage.dtype))
+
+    def use_memmap(self, shape, dtype):
+        if self.memmap_import is not None:
+            return self.memmap_import
+        return tifffile.product(shape) * numpy.dtype(dtype).itemsize > self.memmap_threshold
+
     def can_write_data_and_metadata(self, data_and_metadata, extension):
         #return data_and_metadata.is_data_2d or data_and_metadata.is_data_1d or data_and_metadata.is_data_3d
         return len(data_and_metadata.data_shape) < 5
@@ -278,16 +320,18 @@ class TIFFIODelegate(object):
             
             # last data axis depends on whether data is rgb(a) or not
             last_data_axis = -1
+            # channels of rgb(a) data are swapped chunk-wise while writing
+            channel_order = None
             
             # check and adapt for rgb(a) data            
             if data_and_metadata.is_data_rgb:
-                data = data[...,(2, 1, 0)]
+                channel_order = (2, 1, 0)
                 data_shape = data_shape[:-1]
                 tifffile_shape[-1] = 3
                 last_data_axis = -2
             if data_and_metadata.is_data_rgba:
                 data_shape = data_shape[:-1]
-                data = data[...,(2, 1, 0, 3)]
+                channel_order = (2, 1, 0, 3)
                 tifffile_shape[-1] = 4
                 last_data_axis = -2
                 
@@ -324,7 +368,7 @@ class TIFFIODelegate(object):
                     # use data y-calibration as y-calibration in tif
                     resolution += (1/calibrations[-2].scale, ) if calibrations[-2].scale != 0 else (1, )
             
-            # change axis order if necessary
+            # change axis order if necessary (moveaxis returns views, the data is copied chunk-wise while writing)
             if data_and_metadata.collection_dimension_count > 0:
                 # for a collection we need to move the data axis in front of collection axis
                 data = numpy.moveaxis(data, last_data_axis, 0)
@@ -339,16 +383,92 @@ class TIFFIODelegate(object):
             if unit is not None:
                 tifffile_metadata['unit'] = unit
             
-            data = data.reshape(tuple(tifffile_shape))
+            tifffile_shape = tuple(int(n) for n in tifffile_shape)
+            page_size = tifffile_shape[3] * tifffile_shape[4] * tifffile_shape[5]
             
             # Change dtype if necessary to make tif compatible with imagej
-            if not data.dtype in [numpy.float32, numpy.uint8, numpy.uint16]:
-                data = data.astype(numpy.float32)
+            dtype = data.dtype
+            if not dtype in [numpy.float32, numpy.uint8, numpy.uint16]:
+                dtype = numpy.dtype(numpy.float32)
+            # the data is passed to tifffile in chunks, which are converted to dtype one at a time
+            compression = self.get_compression_kwargs()
+            compression['shape'] = tifffile_shape
+            compression['dtype'] = dtype
+            tile = self.export_tile_size
+            if tile and max(tifffile_shape[3:5]) > tile:
+                compression['tile'] = (tile, tile)
+            if not is_imagej_compression(compression) or 'tile' in compression:
+                # ImageJ can not read LZMA or zstd compressed or tiled files, the metadata is saved in the json image
+                # description
+                tifffile.imsave(file_path, self.iter_export_chunks(data, page_size, channel_order), resolution=resolution, metadata=tifffile_metadata, software='Nion Swift', **compression)
+                return
             try:
-                tifffile.imsave(file_path, data, resolution=resolution, imagej=True, metadata=tifffile_metadata, software='Nion Swift')
+                tifffile.imsave(file_path, self.iter_export_chunks(data, page_size, channel_order), resolution=resolution, imagej=True, metadata=tifffile_metadata, software='Nion Swift', **compression)
             except Exception as detail:
-                tifffile.imsave(file_path, data, resolution=resolution, metadata=tifffile_metadata)
+                tifffile.imsave(file_path, self.iter_export_chunks(data, page_size, channel_order), resolution=resolution, metadata=tifffile_metadata, **compression)
                 logging.warn('Could not save metadata in tiff. Reason: ' + str(detail))
+
+    def iter_export_chunks(self, data, page_size, channel_order=None):
+        # yields consecutive chunks of data in C order, each containing whole pages of page_size elements. Chunks are
+        # views of the trailing axes of data that span whole pages, so at most one chunk is copied at a time. If
+        # channel_order is given, the last axis of each chunk is reordered (e.g. from rgb to bgr).
+        split_axis = 0
+        for axis in range(data.ndim, -1, -1):
+            if int(numpy.prod(data.shape[axis:])) % page_size == 0:
+                split_axis = axis
+                break
+        for index in numpy.ndindex(*data.shape[:split_axis]):
+            chunk = data[index]
+            if channel_order is not None:
+                chunk = chunk[..., channel_order]
+            yield chunk
+
+    def open_sequence_writer(self, file_path, data_and_metadata, sequence_calibration=None):
+        # returns a SequenceWriter that appends frames like data_and_metadata to a new file. data_and_metadata is a
+        # single 1d or 2d frame that provides the shape, dtype, calibrations and metadata of the frames.
+        # sequence_calibration is the calibration of the sequence axis.
+        if data_and_metadata.is_sequence or data_and_metadata.collection_dimension_count > 0:
+            raise ValueError('Frames of a sequence can not be sequences or collections.')
+        calibrations = data_and_metadata.dimensional_calibrations
+        metadata_dict = self.extract_metadata_dict_from_data_and_metadata(data_and_metadata)
+        metadata_dict['is_sequence'] = True
+        if metadata_dict.get('spatial_calibrations') is not None:
+            calibration = sequence_calibration if sequence_calibration is not None else self.__api.create_calibration()
+            metadata_dict['spatial_calibrations'].insert(0, {'offset': calibration.offset, 'scale': calibration.scale,
+                                                             'units': calibration.units})
+        tifffile_metadata = {'unit': calibrations[-1].units or '', 'nion_swift': json.dumps(metadata_dict)}
+        resolution = (1/calibrations[-1].scale, ) if calibrations[-1].scale != 0 else (1, )
+        if data_and_metadata.datum_dimension_count == 2:
+            resolution += (1/calibrations[-2].scale, ) if calibrations[-2].scale != 0 else (1, )
+        else:
+            resolution += (1,)
+        dtype = data_and_metadata.data.dtype
+        # Change dtype if necessary to make tif compatible with imagej
+        if not dtype in [numpy.float32, numpy.uint8, numpy.uint16]:
+            dtype = numpy.dtype(numpy.float32)
+        return SequenceWriter(file_path, data_and_metadata.data_shape, dtype, data_and_metadata.is_data_rgb,
+                              data_and_metadata.is_data_rgba, resolution, tifffile_metadata,
+                              self.get_compression_kwargs())
+
+    def write_sequence(self, frames, file_path, data_and_metadata, sequence_calibration=None):
+        # writes the frames (numpy arrays) of an iterable, e.g. a generator yielding frames of a live acquisition or of a
+        # memory-mapped sequence, one at a time. Only one frame is held in memory. Raises a ValueError if frames is
+        # empty. See open_sequence_writer.
+        with self.open_sequence_writer(file_path, data_and_metadata, sequence_calibration) as writer:
+            for frame in frames:
+                writer.append(frame)
+
+    def get_compression_kwargs(self):
+        # returns the compression parameters for tifffile.imsave
+        if not self.export_compression:
+            return {}
+        if self.export_compression == 'lzma':
+            return {'compress': 'lzma', 'predictor': True}
+        if self.export_compression == 'deflate':
+            return {'compress': self.export_compression_level, 'predictor': True}
+        if self.export_compression == 'zstd':
+            return {'compress': ('zstd', self.export_compression_level), 'predictor': True}
+        raise ValueError('Unknown compression: {}'.format(self.export_compression))
                 
     def extract_metadata_dict_from_data_and_metadata(self, data_and_metadata):
         metadata_dict = {}
@@ -389,6 +509,79 @@ class TIFFIODelegate(object):
             timestamp = datetime.datetime.fromtimestamp(metadata_dict['timestamp'])
         return dimensional_calibrations, intensity_calibration, timestamp, data_descriptor, metadata
 
+
+def is_imagej_compression(compression):
+    # returns whether ImageJ can read files written with the compression parameters for tifffile.imsave
+    return isinstance(compression.get('compress', 0), int)
+
+
+class SequenceWriter(object):
+    """
+    Writes a sequence to a tif file one frame at a time.
+
+    The frames are appended to the file as they arrive, contiguously if they are not compressed, so sequences larger
+    than memory can be exported. The image description with the final number of frames and the remaining IFDs are
+    written on close. A file without frames can not be read, so it is deleted on close and a ValueError is raised.
+    Use TIFFIODelegate.open_sequence_writer to create a SequenceWriter.
+    """
+
+    def __init__(self, file_path, frame_shape, dtype, is_rgb, is_rgba, resolution, metadata, compression):
+        self.__file_path = file_path
+        self.__frame_shape = tuple(frame_shape)
+        self.__dtype = dtype
+        self.__is_rgb = is_rgb
+        self.__is_rgba = is_rgba
+        self.__resolution = resolution
+        self.__metadata = metadata
+        self.__compression = compression
+        # frames are written as single time points of the 6d imagej shape
+        if is_rgb or is_rgba:
+            self.__tifffile_shape = (1, 1, 1) + (1, ) * (3 - len(frame_shape)) + self.__frame_shape
+        else:
+            self.__tifffile_shape = (1, 1, 1) + (1, ) * (2 - len(frame_shape)) + self.__frame_shape + (1, )
+        # ImageJ can not read LZMA or zstd compressed files, the metadata is saved in the json image description
+        imagej = is_imagej_compression(compression)
+        self.__writer = tifffile.TiffWriter(file_path, imagej=imagej, software='Nion Swift')
+        self.frame_count = 0
+
+    def append(self, frame):
+        # writes a frame (a numpy array of the frame shape) to the file
+        frame = numpy.asarray(frame)
+        if frame.shape != self.__frame_shape:
+            raise ValueError('Frame shape {} does not match the sequence frame shape {}'.format(frame.shape,
+                                                                                              self.__frame_shape))
+        if self.__is_rgb:
+            frame = frame[...,(2, 1, 0)]
+        elif self.__is_rgba:
+            frame = frame[...,(2, 1, 0, 3)]
+        if frame.dtype != self.__dtype:
+            frame = frame.astype(self.__dtype)
+        self.__writer.save(frame.reshape(self.__tifffile_shape), resolution=self.__resolution,
+                           metadata=self.__metadata, **self.__compression)
+        self.frame_count += 1
+
+    def close(self):
+        # writes the image description and the outstanding IFDs and closes the file. If no frame was appended, the
+        # file only contains the TIFF header, so it is deleted and a ValueError is raised.
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+            if self.frame_count == 0:
+                os.remove(self.__file_path)
+                raise ValueError('No frames were written to {}, the file was deleted.'.format(self.__file_path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except ValueError:
+            # do not hide the exception that stopped the sequence before its first frame
+            if exc_type is None:
+                raise
+
+
 class TIFFIOExtension(object):
 
     # required for Swift to recognize this as an extension class.
@@ -0,0 +1,172 @@
+"""
+    Codec throughput benchmarks for the TIFF I/O extension.
+
+    Compares the LZW decoder of the bundled tifffile with the previous pure-Python implementation (and imagecodecs, if
+    installed). Run with "python -m TIFF_IO_MD.benchmark [size_mb]" from the directory that contains the extension
+    packages.
+
+"""
+
+# standard libraries
+import struct
+import sys
+import time
+import warnings
+
+# third party libraries
+import numpy
+
+# local libraries
+from . import tifffile
+
+
+def encode_lzw(data):
+    # returns data LZW encoded like a TIFF strip (MSB first codes with early change, CLEAR code when the table is full)
+    table = dict((bytes(bytearray([i])), i) for i in range(256))
+    next_code = 258
+    width = 9
+    buffer = 256
+    bits = 9
+    result = bytearray()
+
+    def emit(code):
+        nonlocal buffer, bits
+        buffer = (buffer << width) | code
+        bits += width
+        while bits >= 8:
+            bits -= 8
+            result.append((buffer >> bits) & 0xff)
+        buffer &= (1 << bits) - 1
+
+    string = b''
+    for i in range(len(data)):
+        char = data[i:i+1]
+        if string + char in table:
+            string += char
+            continue
+        emit(table[string])
+        table[string + char] = next_code
+        next_code += 1
+        if next_code in (512, 1024, 2048):
+            width += 1
+        elif next_code == 4094:
+            emit(256)
+            table = dict((bytes(bytearray([i])), i) for i in range(256))
+            next_code = 258
+            width = 9
+        string = char
+    if string:
+        emit(table[string])
+        next_code += 1
+        if next_code in (512, 1024, 2048):
+            width += 1
+    emit(257)
+    if bits:
+        result.append((buffer << (8 - bits)) & 0xff)
+    return bytes(result)
+
+
+def decode_lzw_reference(encoded):
+    # the pure-Python LZW decoder of tifffile 2016.10.28, used as baseline
+    len_encoded = len(encoded)
+    bitcount_max = len_encoded * 8
+    unpack = struct.unpack
+    newtable = [bytes([i]) for i in range(256)]
+    newtable.extend((0, 0))
+
+    def next_code():
+        start = bitcount // 8
+        s = encoded[start:start+4]
+        try:
+            code = unpack('>I', s)[0]
+        except Exception:
+            code = unpack('>I', s + b'\x00'*(4-len(s)))[0]
+        code <<= bitcount % 8
+        code &= mask
+        return code >> shr
+
+    switchbitch = {  # code: bit-width, shr-bits, bit-mask
+        255: (9, 23, int(9*'1'+'0'*23, 2)),
+        511: (10, 22, int(10*'1'+'0'*22, 2)),
+        1023: (11, 21, int(11*'1'+'0'*21, 2)),
+        2047: (12, 20, int(12*'1'+'0'*20, 2)), }
+    bitw, shr, mask = switchbitch[255]
+    bitcount = 0
+    if next_code() != 256:
+        raise ValueError("strip must begin with CLEAR code")
+    code = 0
+    oldcode = 0
+    result = []
+    while True:
+        code = next_code()
+        bitcount += bitw
+        if code == 257 or bitcount >= bitcount_max:
+            break
+        if code == 256:
+            table = newtable[:]
+            lentable = 258
+            bitw, shr, mask = switchbitch[255]
+            code = next_code()
+            bitcount += bitw
+            if code == 257:
+                break
+            result.append(table[code])
+        else:
+            if code < lentable:
+                decoded = table[code]
+                newcode = table[oldcode] + decoded[:1]
+            else:
+                newcode = table[oldcode]
+                newcode += newcode[:1]
+                decoded = newcode
+            result.append(decoded)
+            table.append(newcode)
+            lentable += 1
+        oldcode = code
+        if lentable in switchbitch:
+            bitw, shr, mask = switchbitch[lentable]
+    return b''.join(result)
+
+
+def _throughput(decode, encoded, size, repeat):
+    # returns the best decoding throughput in MB/s of the decoded data
+    duration = min(_time(decode, encoded) for i in range(repeat))
+    return size / duration / 2**20
+
+
+def _time(decode, encoded):
+    start = time.perf_counter()
+    decode(encoded)
+    return time.perf_counter() - start
+
+
+def benchmark_lzw(size=2**20, repeat=3):
+    # returns a dict of decoder name: throughput in MB/s for an LZW strip of a noisy 8-bit image of about size bytes.
+    # Raises a RuntimeError if a decoder does not reproduce the data.
+    width = 1024
+    random = numpy.random.RandomState(42)
+    data = numpy.cumsum(random.randint(-2, 3, (max(size // width, 1), width)), axis=1)
+    data = (data % 256).astype(numpy.uint8).tobytes()
+    encoded = encode_lzw(data)
+    decoders = [('reference', decode_lzw_reference), ('tifffile', tifffile.decode_lzw)]
+    try:
+        import imagecodecs
+        decoders.append(('imagecodecs', imagecodecs.lzw_decode))
+    except ImportError:
+        pass
+    results = dict()
+    for name, decode in decoders:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            if decode(encoded)[:len(data)] != data:
+                raise RuntimeError('LZW decoder {} returned wrong data.'.format(name))
+            results[name] = _throughput(decode, encoded, len(data), repeat)
+    return results
+
+
+if __name__ == '__main__':
+    size = int(float(sys.argv[1]) * 2**20) if len(sys.argv) > 1 else 2**20
+    results = benchmark_lzw(size)
+    for name, throughput in results.items():
+        print('LZW decode ({}): {:.1f} MB/s ({:.1f}x reference)'.format(name, throughput,
+                                                                       throughput / results['reference']))
@@ -0,0 +1,55 @@
+"""
+    Regression tests for the TIFF I/O delegate.
+
+    Run with "python -m unittest TIFF_IO_MD.test_tiff_io" from the directory that contains the extension packages.
+
+"""
+
+# standard libraries
+import os
+import shutil
+import tempfile
+import unittest
+
+# third party libraries
+import numpy
+
+# local libraries
+from . import SequenceWriter
+from . import tifffile
+
+
+class TestSequenceWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, 'sequence.tif')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_writer(self):
+        return SequenceWriter(self.file_path, (20, 30), numpy.dtype(numpy.float32), False, False, (1, 1), {}, {})
+
+    def test_frames_are_written(self):
+        data = numpy.random.rand(3, 20, 30).astype(numpy.float32)
+        with self.create_writer() as writer:
+            for frame in data:
+                writer.append(frame)
+        numpy.testing.assert_array_equal(tifffile.imread(self.file_path).reshape(data.shape), data)
+
+    def test_close_without_frames_deletes_file_and_raises(self):
+        writer = self.create_writer()
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertFalse(os.path.exists(self.file_path))
+
+    def test_exception_before_first_frame_is_not_hidden(self):
+        with self.assertRaises(KeyError):
+            with self.create_writer():
+                raise KeyError('frame source failed')
+        self.assertFalse(os.path.exists(self.file_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
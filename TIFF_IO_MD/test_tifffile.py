@@ -0,0 +1,309 @@
+"""
+    Regression tests for the bundled tifffile module.
+
+    Run with "python -m unittest TIFF_IO_MD.test_tifffile" from the directory that contains the extension packages.
+
+"""
+
+# standard libraries
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import zlib
+
+# third party libraries
+import numpy
+
+# local libraries
+from . import benchmark
+from . import tifffile
+
+
+class TestTiffFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assert_pages_equal(self, tif, expected):
+        self.assertEqual(len(tif.pages), len(expected.pages))
+        for page, expected_page in zip(tif.pages, expected.pages):
+            self.assertEqual(page.shape, expected_page.shape)
+            self.assertEqual(page.dtype, expected_page.dtype)
+            self.assertEqual(sorted(page.tags.keys()), sorted(expected_page.tags.keys()))
+            numpy.testing.assert_array_equal(page.asarray(), expected_page.asarray())
+        numpy.testing.assert_array_equal(tif.asarray(), expected.asarray())
+
+    def test_lazy_pages_without_fastij(self):
+        file_path = os.path.join(self.directory, 'pages.tif')
+        tifffile.imsave(file_path, numpy.arange(5 * 8 * 8, dtype=numpy.uint8).reshape(5, 8, 8))
+        with tifffile.TiffFile(file_path) as expected:
+            self.assertEqual(len(expected.pages), 5)
+            for fastij in (False, True):
+                index_directory = os.path.join(self.directory, 'index_{}'.format(fastij))
+                with tifffile.TiffFile(file_path, fastij=fastij) as tif:
+                    self.assert_pages_equal(tif, expected)
+                # the first pass writes the index, the second restores the pages from it
+                for i in range(2):
+                    with tifffile.TiffFile(file_path, fastij=fastij, indexcache=index_directory) as tif:
+                        self.assert_pages_equal(tif, expected)
+                self.assertEqual(len(os.listdir(index_directory)), 1)
+
+
+def unpack_ints_reference(data, itemsize, runlen):
+    # unpacks integers from the string of bits of data, each row of runlen integers starts at a byte boundary
+    bits = ''.join('{:08b}'.format(byte) for byte in bytearray(data))
+    rowbits = -(-runlen * itemsize // 8) * 8
+    values = []
+    for row in range(len(bits) // rowbits):
+        for i in range(runlen):
+            start = row * rowbits + i * itemsize
+            values.append(int(bits[start:start + itemsize], 2))
+    return values
+
+
+def encode_packbits(data):
+    # returns data PackBits encoded, runs of at least three equal bytes are repeated, other bytes are copied literally
+    result = bytearray()
+    literal = bytearray()
+    i = 0
+    while i < len(data):
+        run = 1
+        while i + run < len(data) and run < 128 and data[i + run] == data[i]:
+            run += 1
+        if run > 2 or len(literal) == 128:
+            if literal:
+                result.append(len(literal) - 1)
+                result += literal
+                literal = bytearray()
+        if run > 2:
+            result.append(257 - run)
+            result.append(data[i])
+            i += run
+        else:
+            literal.append(data[i])
+            i += 1
+    if literal:
+        result.append(len(literal) - 1)
+        result += literal
+    return bytes(result)
+
+
+class TestBitCodecs(unittest.TestCase):
+
+    def test_unpack_ints(self):
+        random = numpy.random.RandomState(0)
+        for itemsize in range(1, 33):
+            itembytes = next(i for i in (1, 2, 4) if 8 * i >= itemsize)
+            dtype = '>u{}'.format(itembytes)
+            for runlen in (0, 1, 3, 7, 8, 13):
+                if runlen:
+                    # the data of images consists of complete rows
+                    count = runlen
+                    size = 5 * -(-runlen * itemsize // 8)
+                else:
+                    # without runlen, all bits of bit arrays and byte aligned integers are unpacked, else one row of
+                    # as many integers as fit into the data with whole bytes per integer
+                    size = 12 * itembytes
+                    count = size * 8 // itemsize if itemsize in (1, 8, 16, 32) else size // itembytes
+                data = random.randint(0, 256, size).astype(numpy.uint8).tobytes()
+                result = tifffile.unpack_ints(data, dtype, itemsize, runlen)
+                expected = unpack_ints_reference(data, itemsize, count)
+                self.assertEqual(result.tolist(), expected, (itemsize, runlen))
+
+    def test_packbits(self):
+        random = numpy.random.RandomState(0)
+        runs = [bytes(bytearray([value])) * length for value, length in
+                zip(random.randint(0, 256, 200), random.choice([1, 1, 2, 3, 127, 128, 129, 300], 200))]
+        for data in (b'', b'a', b'ab', b'aaa', bytes(bytearray(range(256))), b''.join(runs),
+                     random.randint(0, 256, 1000).astype(numpy.uint8).tobytes()):
+            encoded = encode_packbits(data)
+            self.assertEqual(tifffile.decode_packbits(encoded), data)
+            # header 128 is a no-op
+            self.assertEqual(tifffile.decode_packbits(b'\x80' + encoded + b'\x80'), data)
+
+    def test_packbits_truncated(self):
+        # the last run is cut at the end of the data
+        self.assertEqual(tifffile.decode_packbits(b'\x05abc'), b'abc')
+        self.assertEqual(tifffile.decode_packbits(b'\x01ab\xfd'), b'ab')
+
+    def test_reverse_bitorder(self):
+        data = bytes(bytearray(range(256)))
+        expected = bytes(bytearray(int('{:08b}'.format(byte)[::-1], 2) for byte in bytearray(data)))
+        self.assertEqual(tifffile.reverse_bitorder(data), expected)
+        array = numpy.frombuffer(data, numpy.uint16).copy()
+        tifffile.reverse_bitorder(array)
+        self.assertEqual(array.tobytes(), expected)
+
+
+class TestFloatPredictor(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def images(self):
+        # yields smooth float images with 1, 3 and 4 samples per pixel of all float types and byte orders, including
+        # images of width 1
+        random = numpy.random.RandomState(0)
+        for dtype in ('float16', 'float32', 'float64'):
+            for byteorder in '<>':
+                for width in (1, 37):
+                    for samples in (1, 3, 4):
+                        shape = (21, width) if samples == 1 else (21, width, samples)
+                        data = numpy.cumsum(random.standard_normal(shape), axis=1) * 100
+                        yield data.astype(numpy.dtype(dtype).newbyteorder(byteorder))
+
+    def test_encode_decode(self):
+        for data in self.images():
+            planes = data.reshape(data.shape[:2] + (-1,))
+            original = planes.copy()
+            # encoded strips are decoded from read-only views of the decompressed bytes
+            encoded = numpy.frombuffer(tifffile.encode_floats(planes).tobytes(), data.dtype).reshape(planes.shape)
+            # the caller's array, e.g. big-endian data of width 1, is not modified
+            numpy.testing.assert_array_equal(planes, original)
+            self.assertEqual(planes.tobytes(), original.tobytes())
+            decoded = tifffile.decode_floats(encoded)
+            self.assertEqual(decoded.tobytes(), original.tobytes())
+            # decoding into a non-contiguous view of a larger output array
+            out = numpy.zeros((planes.shape[0], planes.shape[1] + 2, planes.shape[2]), data.dtype)
+            tifffile.decode_floats(encoded, out=out[:, 1:-1])
+            self.assertEqual(out[:, 1:-1].tobytes(), original.tobytes())
+            self.assertFalse(out[:, 0].any() or out[:, -1].any())
+
+    def test_strips_and_tiles(self):
+        file_path = os.path.join(self.directory, 'float.tif')
+        for data in self.images():
+            original = data.copy()
+            photometric = 'minisblack' if data.ndim == 2 else 'rgb'
+            for layout in (dict(rowsperstrip=4), dict(tile=(16, 16))):
+                byteorder = data.dtype.str[0]
+                tifffile.imsave(file_path, data, byteorder=byteorder, photometric=photometric, compress=6,
+                                predictor=True, **layout)
+                self.assertEqual(data.tobytes(), original.tobytes())
+                with tifffile.TiffFile(file_path) as tif:
+                    page = tif.pages[0]
+                    self.assertEqual(page.predictor, 'float')
+                    self.assertEqual(tif.byteorder, byteorder)
+                    numpy.testing.assert_array_equal(page.asarray(), data)
+                    numpy.testing.assert_array_equal(page.asarray(maxworkers=1), data)
+                    numpy.testing.assert_array_equal(page.read_region(3, 0, 10, 1), data[3:13, :1])
+
+
+class TestDecodeLzw(unittest.TestCase):
+
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        # poorly and well compressible data, both long enough to fill the code table several times
+        self.noise = random.randint(0, 256, 20000).astype(numpy.uint8).tobytes()
+        self.smooth = (numpy.cumsum(random.randint(-2, 3, 2**15)) % 256).astype(numpy.uint8).tobytes()
+
+    def decode(self, decode, encoded):
+        # returns the decoded data or the type of the raised exception, warnings about truncated strips are ignored
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            try:
+                return decode(encoded)
+            except Exception as e:
+                return type(e)
+
+    def test_random_data(self):
+        random = numpy.random.RandomState(1)
+        for size in (1, 2, 3, 10, 255, 256, 1000):
+            data = random.randint(0, 256, size).astype(numpy.uint8).tobytes()
+            self.assertEqual(tifffile.decode_lzw(benchmark.encode_lzw(data)), data)
+
+    def test_table_reset(self):
+        for data in (self.noise, self.smooth):
+            encoded = benchmark.encode_lzw(data)
+            # more codes than fit in the table of 4094 entries, so the encoder emits CLEAR codes within the strip
+            self.assertGreater(len(encoded) * 8 // 12, 4094)
+            self.assertEqual(tifffile.decode_lzw(encoded), data)
+            self.assertEqual(benchmark.decode_lzw_reference(encoded), data)
+
+    def test_truncated_strips(self):
+        for data in (self.noise, self.smooth):
+            encoded = benchmark.encode_lzw(data)
+            sizes = set(range(4, 24))
+            sizes.update(range(len(encoded) - 12, len(encoded)))
+            sizes.update(range(4, len(encoded), len(encoded) // 16 + 1))
+            for size in sorted(sizes):
+                expected = self.decode(benchmark.decode_lzw_reference, encoded[:size])
+                self.assertEqual(self.decode(tifffile.decode_lzw, encoded[:size]), expected, size)
+
+
+class TestTiffSequence(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached_layout_compares_strip_offsets_of_multistrip_files(self):
+        # the strip offsets are stored outside of the IFD entries at the same position in both files, but the image
+        # data of the second file starts later because of its longer software tag
+        data = numpy.arange(2 * 2 * 20 * 30, dtype=numpy.uint16).reshape(2, 2, 20, 30)
+        for i in range(2):
+            tifffile.imsave(os.path.join(self.directory, 'm_{}.tif'.format(i)), data[i], planarconfig='planar',
+                            software='x' * (10 + 40 * i))
+        with tifffile.TiffFile(os.path.join(self.directory, 'm_0.tif')) as tif:
+            self.assertEqual(len(tif.pages[0].strip_offsets), 2)
+        result = tifffile.TiffSequence(os.path.join(self.directory, 'm_*.tif'), pattern=None).asarray()
+        numpy.testing.assert_array_equal(result, data)
+
+
+class TestTiffWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_tiles(self, file_path, decompress):
+        # returns the stored tiles of the first page, including the padding of edge tiles
+        with tifffile.TiffFile(file_path) as tif:
+            page = tif.pages[0]
+            shape = (page.tile_length, page.tile_width)
+            with open(file_path, 'rb') as f:
+                tiles = []
+                for offset, byte_count in zip(page.tile_offsets, page.tile_byte_counts):
+                    f.seek(offset)
+                    tiles.append(numpy.frombuffer(decompress(f.read(byte_count)), numpy.uint16).reshape(shape))
+        return tiles
+
+    def test_edge_tiles_are_padded_with_zeros(self):
+        data = numpy.ones((100, 90), numpy.uint16)
+        for compress, decompress in ((0, lambda x: x), (6, zlib.decompress)):
+            file_path = os.path.join(self.directory, 'tiles.tif')
+            tifffile.imsave(file_path, data, compress=compress, tile=(32, 32))
+            tiles = self.read_tiles(file_path, decompress)
+            self.assertEqual(len(tiles), 4 * 3)
+            for i, tile in enumerate(tiles):
+                y, x = divmod(i, 3)
+                expected = numpy.zeros((32, 32), numpy.uint16)
+                expected[:100 - y * 32, :90 - x * 32] = 1
+                numpy.testing.assert_array_equal(tile, expected)
+
+    def test_compressed_tiles_are_deterministic(self):
+        data = numpy.arange(100 * 90, dtype=numpy.uint16).reshape(100, 90)
+        hashes = set()
+        for i in range(5):
+            file_path = os.path.join(self.directory, 'tiles_{}.tif'.format(i))
+            tifffile.imsave(file_path, data, compress=6, tile=(32, 32), datetime=datetime.datetime(2020, 1, 1))
+            with open(file_path, 'rb') as f:
+                hashes.add(hashlib.md5(f.read()).hexdigest())
+        self.assertEqual(len(hashes), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
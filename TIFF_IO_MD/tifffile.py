@@ -40,9 +40,9 @@ SGI, ImageJ, MicroManager, FluoView, SEQ and GEL files.
 Only a subset of the TIFF specification is supported, mainly uncompressed
 and losslessly compressed 2**(0 to 6) bit integer, 16, 32 and 64-bit float,
 grayscale and RGB(A) images, which are commonly used in bio-scientific imaging.
-Specifically, reading JPEG and CCITT compressed image data, chroma subsampling,
-or EXIF, IPTC, GPS, and XMP metadata is not implemented. Only primary info
-records are read for STK, FluoView, MicroManager, and NIH Image formats.
+Specifically, reading CCITT compressed image data, chroma subsampling (except
+in JPEG), or EXIF, IPTC, GPS, and XMP metadata is not implemented. Only primary
+info records are read for STK, FluoView, MicroManager, and NIH Image formats.
 
 TIFF, the Tagged Image File Format aka Thousands of Incompatible File Formats,
 is under the control of Adobe Systems. BigTIFF allows for files greater than
@@ -69,6 +69,11 @@ Requirements
 * `Matplotlib 1.5 <http://www.matplotlib.org>`_ (optional for plotting)
 * `Tifffile.c 2016.04.13 <http://www.lfd.uci.edu/~gohlke/>`_
   (recommended for faster decoding of PackBits and LZW encoded strings)
+* `Imagecodecs <https://pypi.org/project/imagecodecs/>`_ or
+  `Zstandard <https://pypi.org/project/zstandard/>`_
+  (optional for Zstandard compression)
+* `Imagecodecs <https://pypi.org/project/imagecodecs/>`_ or
+  `Pillow <https://pypi.org/project/Pillow/>`_ (optional for JPEG compression)
 
 Revisions
 ---------
@@ -258,9 +263,14 @@ import math
 import zlib
 import time
 import json
+import io
 import struct
+import pickle
+import hashlib
 import warnings
 import tempfile
+import threading
+import multiprocessing
 import datetime
 import collections
 from fractions import Fraction
@@ -276,6 +286,21 @@ except ImportError:
     except ImportError:
         lzma = None
 
+try:
+    import imagecodecs
+except ImportError:
+    imagecodecs = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
 try:
     if __package__:
         from . import _tifffile
@@ -293,7 +318,8 @@ __docformat__ = 'restructuredtext en'
 __all__ = (
     'imsave', 'imread', 'imshow', 'TiffFile', 'TiffWriter', 'TiffSequence',
     # utility functions used in oiffile and czifile
-    'FileHandle', 'lazyattr', 'natural_sorted', 'decode_lzw', 'stripnull')
+    'FileHandle', 'lazyattr', 'natural_sorted', 'decode_lzw', 'stripnull',
+    'map_threaded', 'imap_threaded')
 
 
 def imsave(file, data, **kwargs):
@@ -305,15 +331,18 @@ def imsave(file, data, **kwargs):
     ----------
     file : str or binary stream
         File name or writable binary stream, such as a open file or BytesIO.
-    data : array_like
+    data : array_like or iterable of array_like
         Input image. The last dimensions are assumed to be image depth,
         height, width, and samples.
+        An iterable yielding pages requires the 'shape' and 'dtype'
+        parameters.
     kwargs : dict
         Parameters 'byteorder', 'bigtiff', 'software', and 'imagej', are passed
         to the TiffWriter class.
         Parameters 'photometric', 'planarconfig', 'resolution', 'compress',
-        'colormap', 'tile', 'description', 'datetime', 'metadata', 'contiguous'
-        and 'extratags' are passed to the TiffWriter.save function.
+        'colormap', 'tile', 'description', 'datetime', 'metadata', 'contiguous',
+        'extratags', 'predictor', 'rowsperstrip', 'maxworkers', 'shape', and
+        'dtype' are passed to the TiffWriter.save function.
 
     Examples
     --------
@@ -324,8 +353,13 @@ def imsave(file, data, **kwargs):
     tifargs = parse_kwargs(kwargs, 'bigtiff', 'byteorder', 'software',
                            'imagej')
 
+    if kwargs.get('shape') is not None and kwargs.get('dtype') is not None:
+        datasize = product(kwargs['shape'])*numpy.dtype(kwargs['dtype']).itemsize
+    else:
+        data = numpy.asarray(data)
+        datasize = data.size*data.dtype.itemsize
     if 'bigtiff' not in tifargs and 'imagej' not in tifargs and (
-            data.size*data.dtype.itemsize > 2000*2**20):
+            datasize > 2000*2**20):
         tifargs['bigtiff'] = True
 
     with TiffWriter(file, **tifargs) as tif:
@@ -360,6 +394,7 @@ class TiffWriter(object):
         'tile_width': 322, 'tile_length': 323, 'tile_offsets': 324,
         'tile_byte_counts': 325, 'extra_samples': 338, 'sample_format': 339,
         'smin_sample_value': 340, 'smax_sample_value': 341,
+        'ycbcr_subsampling': 530,
         'image_depth': 32997, 'tile_depth': 32998}
 
     def __init__(self, file, bigtiff=False, byteorder=None,
@@ -444,7 +479,8 @@ class TiffWriter(object):
     def save(self, data, photometric=None, planarconfig=None, tile=None,
              contiguous=True, compress=0, colormap=None,
              description=None, datetime=None, resolution=None,
-             metadata={}, extratags=()):
+             metadata={}, extratags=(), predictor=None, rowsperstrip=None,
+             maxworkers=None, shape=None, dtype=None):
         """Write image data and tags to TIFF file.
 
         Image data are written in one stripe per plane by default.
@@ -455,9 +491,13 @@ class TiffWriter(object):
 
         Parameters
         ----------
-        data : numpy.ndarray
+        data : numpy.ndarray or iterable of numpy.ndarray
             Input image. The last dimensions are assumed to be image depth,
             height (length), width, and samples.
+            If shape and dtype are provided, data is an iterable yielding
+            arrays of one or more pages each, in order. The arrays are
+            converted to dtype when written, so the whole image is never
+            held in memory.
             If a colormap is provided, the dtype must be uint8 or uint16 and
             the data values are indices into the last dimension of the
             colormap.
@@ -484,12 +524,18 @@ class TiffWriter(object):
             previous ones, if any, the data are stored contiguously after
             the previous one. Parameters 'photometric' and 'planarconfig' are
             ignored.
-        compress : int or 'lzma'
+        compress : int, str, or (str, int)
             Values from 0 to 9 controlling the level of zlib compression.
             If 0, data are written uncompressed (default).
             Compression cannot be used to write contiguous files.
-            If 'lzma', LZMA compression is used, which is not available on
-            all platforms.
+            Else the name of a compression scheme in TIFF_COMPRESSORS, e.g.
+            'deflate', 'lzma', 'zstd', or 'jpeg', optionally with the
+            compression level (the quality for JPEG). LZMA and Zstandard are
+            not available on all platforms. JPEG is limited to uint8
+            grayscale and RGB images. Other codecs can be added with
+            register_codec.
+            Compressed images are written in strips of 'rowsperstrip' rows,
+            which are compressed in parallel.
         colormap : numpy.ndarray
             RGB color values for the corresponding data value.
             Must be of shape (3, 2**(data.itemsize*8)) and dtype uint16.
@@ -522,6 +568,23 @@ class TiffWriter(object):
                 'Count' values compatible with 'dtype'.
             writeonce : bool
                 If True, the tag is written to the first page only.
+        predictor : bool, 'horizontal', or 'float'
+            Horizontal differencing applied to compressed image data before
+            compression. If True, 'float' is used for floating point and
+            'horizontal' for integer data. Ignored if not compressed or if
+            True and JPEG compressed.
+        rowsperstrip : int
+            The number of rows per strip of compressed images.
+            By default strips of about 256 KB are written.
+        shape : tuple of int
+            Shape of the image if data is an iterable.
+        dtype : numpy.dtype
+            Data type of the image if data is an iterable.
+        maxworkers : int
+            Maximum number of threads used to compress strips or tiles.
+            By default one per CPU. If 1, compress in the calling thread.
+            Compressed strips and tiles are written in order, and only a few
+            per thread are held in memory at any time.
 
         """
         # TODO: refactor this function
@@ -533,11 +596,21 @@ class TiffWriter(object):
         offset_size = self._offset_size
         tag_size = self._tag_size
 
-        data = numpy.asarray(data, dtype=byteorder+data.dtype.char, order='C')
+        if shape is not None and dtype is not None:
+            # use placeholder without memory for data from iterable
+            dataiter = iter(data)
+            data = numpy.empty(1, dtype=byteorder+numpy.dtype(dtype).char)
+            data = numpy.lib.stride_tricks.as_strided(
+                data, tuple(int(i) for i in shape), (0,) * len(shape))
+        else:
+            dataiter = None
+            data = numpy.asarray(data, dtype=byteorder+data.dtype.char,
+                                 order='C')
         if data.size == 0:
             raise ValueError("can not save empty array")
 
         # just append contiguous data if possible
+        consecutive = False
         if self._data_shape:
             if (not contiguous or
                     self._data_shape[1:] != data.shape or
@@ -560,8 +633,15 @@ class TiffWriter(object):
                 self._data_shape = (self._data_shape[0] + 1,) + data.shape
                 if not compress:
                     # write contiguous data, write ifds/tags later
-                    fh.write_array(data)
+                    if dataiter is None:
+                        fh.write_array(data)
+                    else:
+                        for chunk in dataiter:
+                            fh.write_array(numpy.asarray(
+                                chunk, dtype=data.dtype, order='C'))
                     return
+                # write compressed page, keep description of first page
+                consecutive = True
 
         if photometric not in (None, 'minisblack', 'miniswhite',
                                'rgb', 'palette'):
@@ -570,20 +650,40 @@ class TiffWriter(object):
             raise ValueError("invalid planarconfig %s" % planarconfig)
 
         # prepare compression
+        codec = None
         if not compress:
             compress = False
             compress_tag = 1
-        elif compress == 'lzma':
-            compress = lzma.compress
-            compress_tag = 34925
-            if self._imagej:
-                raise ValueError("ImageJ can not handle LZMA compression")
-        elif not 0 <= compress <= 9:
-            raise ValueError("invalid compression level %s" % compress)
-        elif compress:
-            def compress(data, level=compress):
-                return zlib.compress(data, level)
-            compress_tag = 32946
+        else:
+            if isinstance(compress, (tuple, list)):
+                codec, level = compress
+            elif isinstance(compress, basestring):
+                codec, level = compress, None
+            elif not 0 <= compress <= 9:
+                raise ValueError("invalid compression level %s" % compress)
+            else:
+                codec, level = 'deflate', compress
+            if codec not in TIFF_COMPRESSORS:
+                raise ValueError("cannot compress %s" % codec)
+            if self._imagej and codec != 'deflate':
+                raise ValueError("ImageJ can not handle %s compression"
+                                 % codec)
+            compress_tag, encoder = TIFF_COMPRESSORS[codec]
+
+            def compress(data, level=level):
+                return encoder(data, level)
+
+        # prepare predictor
+        if not compress or (codec == 'jpeg' and predictor is True):
+            predictor = None
+        elif predictor is True:
+            predictor = 'float' if data.dtype.kind == 'f' else 'horizontal'
+        if predictor not in (None, False, 'horizontal', 'float'):
+            raise ValueError("invalid predictor %s" % predictor)
+        if ((predictor == 'horizontal' and data.dtype.kind not in 'iu') or
+                (predictor == 'float' and data.dtype.kind != 'f')):
+            raise ValueError("%s predictor does not support data type '%s'"
+                             % (predictor, data.dtype.char))
 
         # prepare ImageJ format
         if self._imagej:
@@ -729,6 +829,12 @@ class TiffWriter(object):
         if photometric == 'rgb' and samplesperpixel == 2:
             raise ValueError("not a RGB image (samplesperpixel=2)")
 
+        if codec == 'jpeg' and (data.dtype.char != 'B' or predictor or
+                                extrasamples or shape[-1] not in (1, 3) or
+                                (tile and tile[0] > 1)):
+            raise ValueError("JPEG compression supports only uint8 "
+                             "grayscale and RGB images")
+
         bytestr = bytes if sys.version[0] == '2' else (
             lambda x: bytes(x, 'utf-8') if isinstance(x, str) else x)
         tags = []  # list of (code, ifdentry, ifdvalue, writeonce)
@@ -801,8 +907,11 @@ class TiffWriter(object):
             addtag('image_description', 's', 0, description, writeonce=True)
 
         # write shape and metadata to image_description
-        self._metadata = {} if not metadata else metadata
-        if self._imagej:
+        if not consecutive:
+            self._metadata = {} if not metadata else metadata
+        if consecutive:
+            description = None
+        elif self._imagej:
             description = imagej_description(
                 data_shape, shape[-1] in (3, 4), self._colormap is not None,
                 **self._metadata)
@@ -812,9 +921,9 @@ class TiffWriter(object):
         else:
             description = None
         if description:
-            # add 32 bytes buffer
+            # add 64 bytes buffer
             # the image description might be updated later with the final shape
-            description += b'\0'*32
+            description += b'\0'*64
             self._description_len = len(description)
             addtag('image_description', 's', 0, description, writeonce=True)
 
@@ -826,6 +935,8 @@ class TiffWriter(object):
         addtag('datetime', 's', 0, datetime.strftime("%Y:%m:%d %H:%M:%S"),
                writeonce=True)
         addtag('compression', 'H', 1, compress_tag)
+        if predictor:
+            addtag('predictor', 'H', 1, {'horizontal': 2, 'float': 3}[predictor])
         addtag('image_width', 'I', 1, shape[-2])
         addtag('image_length', 'I', 1, shape[-3])
         if tile:
@@ -837,8 +948,14 @@ class TiffWriter(object):
         addtag('new_subfile_type', 'I', 1, 0)
         addtag('sample_format', 'H', 1,
                {'u': 1, 'i': 2, 'f': 3, 'c': 6}[data.dtype.kind])
-        addtag('photometric', 'H', 1, {'miniswhite': 0, 'minisblack': 1,
-                                       'rgb': 2, 'palette': 3}[photometric])
+        if codec == 'jpeg' and shape[-1] == 3:
+            # the JPEG encoder converts RGB pixels to YCbCr
+            addtag('photometric', 'H', 1, 6)
+            addtag('ycbcr_subsampling', 'H', 2, (1, 1))
+        else:
+            addtag('photometric', 'H', 1, {
+                'miniswhite': 0, 'minisblack': 1, 'rgb': 2, 'palette': 3
+                }[photometric])
         if colormap is not None:
             addtag('color_map', 'H', colormap.size, colormap)
         addtag('samples_per_pixel', 'H', 1, samplesperpixel)
@@ -865,7 +982,13 @@ class TiffWriter(object):
                 resolution_unit = 2
             addtag('resolution_unit', 'H', 1, resolution_unit)
         if not tile:
-            addtag('rows_per_strip', 'I', 1, shape[-3])  # * shape[-4]
+            if not compress:
+                rowsperstrip = shape[-3]  # * shape[-4]
+            elif rowsperstrip is None:
+                rowsperstrip = 2**18 // (product(shape[-2:]) *
+                                         data.dtype.itemsize)
+            rowsperstrip = min(max(int(rowsperstrip), 1), shape[-3])
+            addtag('rows_per_strip', 'I', 1, rowsperstrip)
 
         if tile:
             # use one chunk per tile per plane
@@ -877,14 +1000,67 @@ class TiffWriter(object):
                 product(tile) * shape[-1] * data.dtype.itemsize] * numtiles
             addtag(tag_byte_counts, offset_format, numtiles, strip_byte_counts)
             addtag(tag_offsets, offset_format, numtiles, [0] * numtiles)
-            # allocate tile buffer
-            chunk = numpy.empty(tile + (shape[-1],), dtype=data.dtype)
         else:
-            # use one strip per plane
+            # use one strip per plane if not compressed
+            numstrips = (shape[-3] + rowsperstrip - 1) // rowsperstrip
+            numstrips *= shape[1]
             strip_byte_counts = [
-                data[0, 0].size * data.dtype.itemsize] * shape[1]
-            addtag(tag_byte_counts, offset_format, shape[1], strip_byte_counts)
-            addtag(tag_offsets, offset_format, shape[1], [0] * shape[1])
+                data[0, 0].size * data.dtype.itemsize] * numstrips
+            addtag(tag_byte_counts, offset_format, numstrips,
+                   strip_byte_counts)
+            addtag(tag_offsets, offset_format, numstrips, [0] * numstrips)
+
+        def encode(chunk):
+            # apply predictor to strip or tile and compress
+            if predictor == 'horizontal':
+                diff = numpy.empty_like(chunk)
+                diff[..., :1, :] = chunk[..., :1, :]
+                numpy.subtract(chunk[..., 1:, :], chunk[..., :-1, :],
+                               out=diff[..., 1:, :])
+                chunk = diff
+            elif predictor == 'float':
+                chunk = encode_floats(chunk)
+            return compress(chunk)
+
+        def iter_pages():
+            # yield pages of data or of arrays from the data iterable
+            if dataiter is None:
+                for page in data:
+                    yield page
+                return
+            count = 0
+            for chunk in dataiter:
+                chunk = numpy.asarray(chunk, dtype=data.dtype, order='C')
+                for page in chunk.reshape((-1,) + shape[1:]):
+                    count += 1
+                    yield page
+            if count != shape[0]:
+                raise ValueError("iterable yielded %i instead of %i pages"
+                                 % (count, shape[0]))
+
+        def iter_tiles(page):
+            # yield tiles of page padded with zeros in storage order
+            # a new buffer is used for each tile if tiles are compressed
+            # concurrently, else the buffer is reused
+            chunk = numpy.empty(tile + (shape[-1],), dtype=data.dtype)
+            for plane in page:
+                for tz in range(tiles[0]):
+                    for ty in range(tiles[1]):
+                        for tx in range(tiles[2]):
+                            c0 = min(tile[0], shape[2] - tz*tile[0])
+                            c1 = min(tile[1], shape[3] - ty*tile[1])
+                            c2 = min(tile[2], shape[4] - tx*tile[2])
+                            if compress:
+                                chunk = numpy.zeros_like(chunk)
+                            else:
+                                chunk[c0:] = 0
+                                chunk[:, c1:] = 0
+                                chunk[:, :, c2:] = 0
+                            chunk[:c0, :c1, :c2] = plane[
+                                tz*tile[0]:tz*tile[0]+c0,
+                                ty*tile[1]:ty*tile[1]+c1,
+                                tx*tile[2]:tx*tile[2]+c2]
+                            yield chunk
 
         # add extra tags from user
         for t in extratags:
@@ -901,6 +1077,7 @@ class TiffWriter(object):
 
         # if not compressed or tiled, write the first ifd and then all data
         # contiguously; else, write all ifds and data interleaved
+        pages = iter_pages()
         for pageindex in range(shape[0] if (compress or tile) else 1):
             # update pointer at ifd_offset
             pos = fh.tell()
@@ -937,33 +1114,27 @@ class TiffWriter(object):
             data_offset = fh.tell()
             if compress:
                 strip_byte_counts = []
-            if tile:
-                for plane in data[pageindex]:
-                    for tz in range(tiles[0]):
-                        for ty in range(tiles[1]):
-                            for tx in range(tiles[2]):
-                                c0 = min(tile[0], shape[2] - tz*tile[0])
-                                c1 = min(tile[1], shape[3] - ty*tile[1])
-                                c2 = min(tile[2], shape[4] - tx*tile[2])
-                                chunk[c0:, c1:, c2:] = 0
-                                chunk[:c0, :c1, :c2] = plane[
-                                    tz*tile[0]:tz*tile[0]+c0,
-                                    ty*tile[1]:ty*tile[1]+c1,
-                                    tx*tile[2]:tx*tile[2]+c2]
-                                if compress:
-                                    t = compress(chunk)
-                                    strip_byte_counts.append(len(t))
-                                    fh.write(t)
-                                else:
-                                    fh.write_array(chunk)
-                                    fh.flush()
+            if tile and not compress:
+                for chunk in iter_tiles(next(pages)):
+                    fh.write_array(chunk)
+                    fh.flush()
             elif compress:
-                for plane in data[pageindex]:
-                    plane = compress(plane)
-                    strip_byte_counts.append(len(plane))
-                    fh.write(plane)
-            else:
+                page = next(pages)
+                if tile:
+                    chunks = iter_tiles(page)
+                else:
+                    chunks = (plane[0, i:i+rowsperstrip]
+                              for plane in page
+                              for i in range(0, shape[-3], rowsperstrip))
+                # compress in a pool of threads, write in order
+                for chunk in imap_threaded(encode, chunks, maxworkers):
+                    strip_byte_counts.append(len(chunk))
+                    fh.write(chunk)
+            elif dataiter is None:
                 fh.write_array(data)
+            else:
+                for page in pages:
+                    fh.write_array(page)
 
             # update strip/tile offsets and byte_counts if necessary
             pos = fh.tell()
@@ -997,12 +1168,18 @@ class TiffWriter(object):
             if pageindex == 0:
                 tags = [tag for tag in tags if not tag[-1]]
 
+        if dataiter is not None:
+            for page in pages:
+                raise ValueError("iterable yielded more than %i pages"
+                                 % shape[0])
+
         # if uncompressed, write remaining ifds/tags later
         if not (compress or tile):
             self._tags = tags
 
         self._shape = shape
-        self._data_shape = (1,) + data_shape
+        if not consecutive:
+            self._data_shape = (1,) + data_shape
         self._data_dtype = data.dtype
         self._data_offset = data_offset
         self._data_byte_counts = strip_byte_counts
@@ -1093,8 +1270,12 @@ class TiffWriter(object):
         colormapped = self._colormap is not None
         if self._imagej:
             isrgb = self._shape[-1] in (3, 4)
+            data_shape = self._data_shape
+            if len(data_shape) > 6:
+                # consecutive hyperstacks are stacked along the T axis
+                data_shape = (product(data_shape[:-5]),) + data_shape[-5:]
             description = imagej_description(
-                self._data_shape, isrgb, colormapped, **self._metadata)
+                data_shape, isrgb, colormapped, **self._metadata)
         else:
             description = image_description(
                 self._data_shape, colormapped, **self._metadata)
@@ -1208,8 +1389,8 @@ class TiffFile(object):
 
     Attributes
     ----------
-    pages : list of TiffPage
-        All TIFF pages in file.
+    pages : TiffPages
+        All TIFF pages in file. Pages are parsed when first accessed.
     series : list of TiffPageSeries
         TIFF pages with compatible shapes and types.
     micromanager_metadata: dict
@@ -1227,7 +1408,7 @@ class TiffFile(object):
     """
     def __init__(self, arg, name=None, offset=None, size=None,
                  multifile=True, multifile_close=True, maxpages=None,
-                 fastij=True, is_ome=None):
+                 fastij=True, is_ome=None, indexcache=None, maxfiles=32):
         """Initialize instance from file.
 
         Parameters
@@ -1247,9 +1428,10 @@ class TiffFile(object):
             If True (default), series may include pages from multiple files.
             Currently applies to OME-TIFF only.
         multifile_close : bool
-            If True (default), keep the handles of other files in multifile
-            series closed. This is inefficient when few files refer to
-            many pages. If False, the C runtime may run out of resources.
+            If True (default), keep at most 'maxfiles' handles of other files
+            in multifile series open and close the least recently used.
+            If False, keep all files open, which might exhaust the file
+            handles of the C runtime.
         maxpages : int
             Number of pages to read (default: no limit).
         fastij : bool
@@ -1258,6 +1440,17 @@ class TiffFile(object):
             thousands of pages.
         is_ome : bool
             If False, disable processing of OME-XML metadata.
+        indexcache : str
+            Optional directory, where the offsets and tags of the pages of
+            the file are cached between sessions. A valid index of the file
+            is loaded instead of reading the chain of IFD offsets, and pages
+            are restored from their cached tags instead of parsing the IFD.
+            The index is updated on close. It is invalidated when the file
+            size or modification time changes. The index is stored with
+            pickle, so only use trusted directories.
+        maxfiles : int
+            Maximum number of other files in multifile series kept open
+            if 'multifile_close' is True.
 
         """
         if is_ome is False:
@@ -1268,9 +1461,14 @@ class TiffFile(object):
         self.offset_size = None
         self.pages = []
         self._multifile = bool(multifile)
-        self._multifile_close = bool(multifile_close)
         self._files = {self._fh.name: self}  # cache of TiffFiles
+        # open handles of other files in multifile series
+        self._filecache = FileCache(maxfiles if multifile_close else None)
+        self._indexfile = None
+        self._indexkey = None
         try:
+            if indexcache and not maxpages:
+                self._init_index(indexcache, fastij)
             self._fromfile(maxpages, fastij)
         except Exception:
             self._fh.close()
@@ -1288,6 +1486,8 @@ class TiffFile(object):
 
     def close(self):
         """Close open file handle(s)."""
+        self._save_index()
+        self._filecache.clear()
         for tif in self._files.values():
             tif._fh.close()
         self._files = {}
@@ -1312,19 +1512,7 @@ class TiffFile(object):
             self.offset_size = 4
         else:
             raise ValueError("not a TIFF file")
-        self.pages = []
-        while True:
-            try:
-                page = TiffPage(self)
-                self.pages.append(page)
-            except StopIteration:
-                break
-            if maxpages and len(self.pages) > maxpages:
-                break
-            if fastij:
-                if page._patch_imagej():
-                    break  # only read the first page of ImageJ files
-                fastij = False
+        self.pages = TiffPages(self, maxpages, fastij, self._load_index())
 
         if not self.pages:
             raise ValueError("empty TIFF file")
@@ -1337,6 +1525,60 @@ class TiffFile(object):
             self._fix_lsm_strip_offsets()
             self._fix_lsm_strip_byte_counts()
 
+    def _init_index(self, indexcache, fastij):
+        """Set name of index file in cache directory and key of file."""
+        if not self._fh._close or not os.path.isfile(self._fh.path):
+            return  # not a named file
+        path = self._fh.path
+        stat = os.stat(path)
+        name = hashlib.sha1(repr((path, self._fh._offset, self._fh.size)).
+                            encode('utf-8')).hexdigest()
+        self._indexfile = os.path.join(indexcache, name + '.tifindex')
+        self._indexkey = (TIFF_INDEX_VERSION, path, self._fh._offset,
+                          self._fh.size, stat.st_size, stat.st_mtime,
+                          bool(fastij))
+
+    def _load_index(self):
+        """Return page index of file from cache if valid, else None."""
+        if not self._indexfile or not os.path.isfile(self._indexfile):
+            return
+        try:
+            with open(self._indexfile, 'rb') as fh:
+                index = pickle.load(fh)
+            if index['key'] != self._indexkey:
+                return
+            if index['offset_size'] != self.offset_size:
+                return
+            return index
+        except Exception as e:
+            warnings.warn("failed to load page index: %s" % e)
+
+    def _save_index(self):
+        """Write offsets and tags of parsed pages to index cache."""
+        if not self._indexfile or not isinstance(self.pages, TiffPages):
+            return
+        if not self.pages._changed or not self.pages._tags:
+            return
+        self.pages._changed = False
+        index = {'key': self._indexkey,
+                 'offset_size': self.offset_size,
+                 'offsets': self.pages._offsets,
+                 'tags': self.pages._tags}
+        try:
+            dirname = os.path.dirname(self._indexfile)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            # write to temporary file and rename it to not leave a
+            # partially written index if interrupted
+            with tempfile.NamedTemporaryFile(dir=dirname, suffix='.tmp',
+                                             delete=False) as fh:
+                pickle.dump(index, fh, 2)
+            if os.path.exists(self._indexfile) and sys.platform == 'win32':
+                os.remove(self._indexfile)
+            os.rename(fh.name, self._indexfile)
+        except Exception as e:
+            warnings.warn("failed to write page index: %s" % e)
+
     def _fix_lsm_strip_offsets(self):
         """Unwrap strip offsets for LSM files greater than 4 GB."""
         # each series and position require separate unwrapping (undocumented)
@@ -1382,7 +1624,8 @@ class TiffFile(object):
                 page.strip_byte_counts = tuple(
                     strips[offset] for offset in page.strip_offsets)
 
-    def asarray(self, key=None, series=None, memmap=False, tempdir=None):
+    def asarray(self, key=None, series=None, memmap=False, tempdir=None,
+                maxworkers=None):
         """Return image data from multiple TIFF pages as numpy array.
 
         By default the first image series is returned.
@@ -1399,6 +1642,9 @@ class TiffFile(object):
             file is created.
         tempdir : str
             The directory where the memory-mapped file will be created.
+        maxworkers : int or None
+            Maximum number of threads used to decode compressed pages.
+            By default one per CPU. If 1, decode in the calling thread.
 
         """
         if key is None and series is None:
@@ -1432,7 +1678,8 @@ class TiffFile(object):
                 result = apply_colormap(result, pages[0].color_map)
             else:
                 result = stack_pages(pages, memmap=memmap, tempdir=tempdir,
-                                     colormapped=False, squeeze=False)
+                                     colormapped=False, squeeze=False,
+                                     maxworkers=maxworkers)
         elif len(pages) == 1:
             result = pages[0].asarray(memmap=memmap)
         elif self.is_ome:
@@ -1450,30 +1697,18 @@ class TiffFile(object):
                 result = numpy.empty(series.shape, series.dtype).reshape(-1)
             index = 0
 
-            class KeepOpen:
-                # keep Tiff files open between consecutive pages
-                def __init__(self, parent, close):
-                    self.master = parent
-                    self.parent = parent
-                    self._close = close
-
-                def open(self, page):
-                    if self._close and page and page.parent != self.parent:
-                        if self.parent != self.master:
-                            self.parent.filehandle.close()
-                        self.parent = page.parent
-                        self.parent.filehandle.open()
-
-                def close(self):
-                    if self._close and self.parent != self.master:
-                        self.parent.filehandle.close()
-
-            keep = KeepOpen(self, self._multifile_close)
             for page in pages:
-                keep.open(page)
                 if page:
-                    a = page.asarray(memmap=False, colormapped=False,
-                                     reopen=False)
+                    # keep recently used files open between pages
+                    fh = page.parent.filehandle
+                    if page.parent is not self:
+                        self._filecache.open(fh)
+                    try:
+                        a = page.asarray(memmap=False, colormapped=False,
+                                         reopen=False)
+                    finally:
+                        if page.parent is not self:
+                            self._filecache.close(fh)
                 else:
                     a = nopage
                 try:
@@ -1482,7 +1717,6 @@ class TiffFile(object):
                     warnings.warn("ome-tiff: %s" % e)
                     break
                 index += a.size
-            keep.close()
         elif key is None and series and series.offset:
             if memmap:
                 result = self.filehandle.memmap_array(
@@ -1492,7 +1726,8 @@ class TiffFile(object):
                 result = self.filehandle.read_array(
                     series.dtype, product(series.shape))
         else:
-            result = stack_pages(pages, memmap=memmap, tempdir=tempdir)
+            result = stack_pages(pages, memmap=memmap, tempdir=tempdir,
+                                 maxworkers=maxworkers)
 
         if key is None:
             try:
@@ -1512,6 +1747,70 @@ class TiffFile(object):
             result.shape = (-1,) + pages[0].shape
         return result
 
+    def read_region(self, top=0, left=0, length=None, width=None, key=None,
+                    series=None, maxworkers=None):
+        """Return rectangular region of image data from TIFF pages as array.
+
+        Only the strips or tiles intersecting the region are read from file.
+        Pages (frames) are selected like in asarray. If the series is stored
+        in a single page, e.g. in contiguous ImageJ hyperstacks, 'key'
+        selects planes of that page. See TiffPage.read_region.
+
+        """
+        if key is None and series is None:
+            series = 0
+        if series is not None:
+            try:
+                series = self.series[series]
+            except (KeyError, TypeError):
+                pass
+            pages = series.pages
+        else:
+            pages = self.pages
+
+        page = next(p for p in pages if p)
+        if length is None:
+            length = page.image_length - top
+        if width is None:
+            width = page.image_width - left
+        kwargs = dict(top=top, left=left, length=length, width=width,
+                      maxworkers=maxworkers)
+        if len(pages) == 1 and pages[0]._shape[0] > 1:
+            result = pages[0].read_region(planes=key, **kwargs)
+        else:
+            if key is None:
+                pass
+            elif isinstance(key, int):
+                pages = [pages[key]]
+            elif isinstance(key, slice):
+                pages = pages[key]
+            elif isinstance(key, collections.Iterable):
+                pages = [pages[k] for k in key]
+            else:
+                raise TypeError("key must be an int, slice, or sequence")
+            if not len(pages):
+                raise ValueError("no pages selected")
+            if any(page is None for page in pages):
+                raise ValueError("missing pages are not supported")
+            result = pages[0].read_region(**kwargs)
+            if len(pages) > 1 or not isinstance(key, int):
+                data = numpy.empty((len(pages),) + result.shape, result.dtype)
+                data[0] = result
+                for i, page in enumerate(pages[1:]):
+                    data[i+1] = page.read_region(**kwargs)
+                result = data
+
+        if key is None:
+            shape = list(series.shape)
+            shape[series.axes.index('Y')] = length
+            shape[series.axes.index('X')] = width
+            try:
+                result.shape = shape
+            except ValueError:
+                warnings.warn("failed to reshape %s to %s" % (
+                    result.shape, tuple(shape)))
+        return result
+
     @lazyattr
     def series(self):
         """Return pages with compatible properties as TiffPageSeries."""
@@ -1530,6 +1829,9 @@ class TiffFile(object):
         elif self.is_nih:
             series = self._nih_series()
 
+        if not series:
+            series = self._shaped_series()
+
         if not series:
             # generic detection of series
             shapes = []
@@ -1575,6 +1877,35 @@ class TiffFile(object):
         series = [s for s in series if sum(s.shape) > 0]
         return series
 
+    def _shaped_series(self):
+        """Return image series in file written by tifffile.
+
+        If the shape in the image description of the first page spans all
+        pages in the file, the pages are assumed to be compatible with the
+        first page and are not parsed.
+
+        """
+        page0 = self.pages[0]
+        if not page0.is_shaped or not page0.shape or len(self.pages) < 2:
+            return []
+        try:
+            metadata = image_description_dict(page0.is_shaped)
+            shape = tuple(int(i) for i in metadata['shape'])
+        except Exception:
+            return []
+        if product(shape) != len(self.pages) * product(page0.shape):
+            return []
+        axes = 'I' + page0.axes
+        if 'axes' in metadata and len(metadata['axes']) == len(shape):
+            axes = metadata['axes']
+        else:
+            try:
+                axes = reshape_axes(axes, (len(self.pages),) + page0.shape,
+                                    shape)
+            except ValueError:
+                return []
+        return [TiffPageSeries(self.pages, shape, page0.dtype, axes)]
+
     def _fluoview_series(self):
         """Return image series in FluoView file."""
         page0 = self.pages[0]
@@ -1742,19 +2073,23 @@ class TiffFile(object):
                             try:
                                 tif = TiffFile(os.path.join(dirname, fname))
                             except (IOError, ValueError):
-                                tif.close()
                                 warnings.warn(
                                     "ome-xml: failed to read '%s'" % fname)
                                 break
                             self._files[uuid.text] = tif
-                            if self._multifile_close:
-                                tif.close()
-                        pages = self._files[uuid.text].pages
+                            self._filecache.add(tif.filehandle)
+                        tif = self._files[uuid.text]
+                        pages = tif.pages
+                        if tif is not self:
+                            self._filecache.open(tif.filehandle)
                         try:
                             for i in range(num if num else len(pages)):
                                 ifds[idx + i] = pages[ifd + i]
                         except IndexError:
                             warnings.warn("ome-xml: index out of range")
+                        finally:
+                            if tif is not self:
+                                self._filecache.close(tif.filehandle)
                         # only process first uuid
                         break
                     else:
@@ -1903,6 +2238,141 @@ class TiffFile(object):
         return len(self.pages) and self.pages[0].is_tvips
 
 
+class TiffPages(object):
+    """Sequence of TIFF pages, parsed when first accessed.
+
+    Only the chain of IFD offsets is read on initialization, which makes
+    opening files with many pages fast. The tags of a page are read and
+    processed the first time the page is accessed.
+
+    """
+    def __init__(self, parent, maxpages=None, fastij=True, index=None):
+        """Read chain of IFD offsets from file.
+
+        The file cursor must be at the storage position of the first IFD
+        offset. The first page is always parsed. If fastij is True and the
+        first page contains contiguous ImageJ data, the other pages are not
+        indexed.
+
+        If index is a page index loaded from the index cache of the parent
+        TiffFile, the IFD offsets are not read from file and pages are
+        restored from their cached tags.
+
+        """
+        self.parent = parent
+        self._offsets = []
+        self._pages = []
+        # pickled tags of pages by index, if the parent uses an index cache
+        self._tags = None if parent._indexfile is None else {}
+        self._changed = False
+
+        if index is not None:
+            self._offsets = list(index['offsets'])
+            self._pages = [None] * len(self._offsets)
+            self._tags = index['tags']
+            if self._offsets:
+                # the first page is inspected while the parent is opened
+                page = self._getpage(0)
+                if fastij:
+                    page._patch_imagej()
+            return
+
+        fh = parent.filehandle
+        byteorder = parent.byteorder
+        offset_size = parent.offset_size
+        offset_format = byteorder + {4: 'I', 8: 'Q'}[offset_size]
+        numtag_format, numtag_size = {4: ('H', 2), 8: ('Q', 8)}[offset_size]
+        numtag_format = byteorder + numtag_format
+        tag_size = {4: 12, 8: 20}[offset_size]
+        unpack = struct.unpack
+
+        pos = fh.tell()
+        offsets = set()
+        while True:
+            fh.seek(pos)
+            try:
+                offset = unpack(offset_format, fh.read(offset_size))[0]
+            except struct.error:
+                warnings.warn("corrupted page list at position %i" % pos)
+                break
+            if not offset:
+                break
+            if offset >= fh.size:
+                warnings.warn("invalid page offset > file size")
+                break
+            if offset in offsets:
+                warnings.warn("circular page list at offset %i" % offset)
+                break
+            fh.seek(offset)
+            try:
+                numtags = unpack(numtag_format, fh.read(numtag_size))[0]
+                if numtags > 4096:
+                    raise ValueError("suspicious number of tags")
+            except Exception:
+                warnings.warn("corrupted page list at offset %i" % offset)
+                break
+            offsets.add(offset)
+            self._offsets.append(offset)
+            self._pages.append(None)
+            if maxpages and len(self._offsets) > maxpages:
+                break
+            if len(self._offsets) == 1:
+                # the first page is inspected while the parent is opened
+                page = self._getpage(0)
+                if fastij and page._patch_imagej():
+                    break  # only read the first page of ImageJ files
+            pos = offset + numtag_size + numtags * tag_size
+        self._changed = self._tags is not None
+
+    def _getpage(self, index):
+        """Return page at index, parse it if necessary."""
+        page = self._pages[index]
+        if page is None:
+            tags = None
+            if self._tags is not None and index in self._tags:
+                tags = pickle.loads(self._tags[index])
+            fh = self.parent.filehandle
+            with fh.lock:
+                reopen = fh.closed
+                if reopen:
+                    fh.open()
+                try:
+                    page = TiffPage(self.parent, index, self._offsets[index],
+                                    tags)
+                    if (self._tags is not None and tags is None and
+                            not page.is_lsm and not page.is_stk):
+                        # LSM and STK pages contain data not stored in tags
+                        self._tags[index] = pickle.dumps(
+                            (fh.tell(), [(name, tag._state)
+                                         for name, tag in page.tags.items()]),
+                            2)
+                        self._changed = True
+                finally:
+                    if reopen:
+                        fh.close()
+            self._pages[index] = page
+        return page
+
+    def __len__(self):
+        """Return number of pages."""
+        return len(self._offsets)
+
+    def __getitem__(self, key):
+        """Return page or list of pages."""
+        if isinstance(key, slice):
+            return [self._getpage(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("page index out of range")
+        return self._getpage(key)
+
+    def __iter__(self):
+        """Return iterator over pages."""
+        for i in range(len(self)):
+            yield self._getpage(i)
+
+
 class TiffPage(object):
     """A TIFF image file directory (IFD).
 
@@ -1947,24 +2417,38 @@ class TiffPage(object):
     5. contig samples_per_pixel.
 
     """
-    def __init__(self, parent):
-        """Initialize instance from file."""
+    def __init__(self, parent, index=None, offset=None, tags=None):
+        """Initialize instance from file.
+
+        If offset is None, the file cursor must be at the storage position
+        of the IFD offset. If tags is a tuple of the file position of the
+        offset to the next IFD and a list of (name, TiffTag._state), the
+        page is restored from the tags instead of read from file.
+
+        """
         self.parent = parent
-        self.index = len(parent.pages)
+        self.index = len(parent.pages) if index is None else index
         self.shape = self._shape = ()
         self.dtype = self._dtype = None
         self.axes = ""
         self.tags = TiffTags()
         self._offset = 0
 
-        self._fromfile()
+        if tags is None:
+            self._fromfile(offset)
+        else:
+            pos, tags = tags
+            self._offset = offset
+            for name, state in tags:
+                self.tags[name] = TiffTag._fromstate(state)
+            self.parent.filehandle.seek(pos)
         self._process_tags()
 
-    def _fromfile(self):
+    def _fromfile(self, offset=None):
         """Read TIFF IFD structure and its tags from file.
 
-        File cursor must be at storage position of IFD offset and is left at
-        offset to next IFD.
+        If offset is None, the file cursor must be at storage position of
+        IFD offset. The cursor is left at offset to next IFD.
 
         Raises StopIteration if offset (first bytes read) is 0
         or a corrupted page list is encountered.
@@ -1975,8 +2459,9 @@ class TiffPage(object):
         offset_size = self.parent.offset_size
 
         # read offset to this IFD
-        fmt = {4: 'I', 8: 'Q'}[offset_size]
-        offset = struct.unpack(byteorder + fmt, fh.read(offset_size))[0]
+        if offset is None:
+            fmt = {4: 'I', 8: 'Q'}[offset_size]
+            offset = struct.unpack(byteorder + fmt, fh.read(offset_size))[0]
         if not offset:
             raise StopIteration()
         if offset >= fh.size:
@@ -1997,9 +2482,10 @@ class TiffPage(object):
             raise StopIteration()
 
         tagcode = 0
-        for _ in range(numtags):
+        for tagoffset, entry, valuedata in self._read_tag_entries(numtags):
             try:
-                tag = TiffTag(self.parent)
+                tag = TiffTag(self.parent, offset=tagoffset, entry=entry,
+                              valuedata=valuedata)
             except TiffTag.Error as e:
                 warnings.warn(str(e))
                 continue
@@ -2049,6 +2535,60 @@ class TiffPage(object):
                              tags['uic2tag'].count))
         fh.seek(pos)
 
+    def _read_tag_entries(self, numtags):
+        """Return list of (offset, entry, valuedata) for tags in IFD.
+
+        The file cursor must be at the first tag entry and is left after
+        the last. The entry table is read at once and decoded with a numpy
+        structured dtype. The values stored outside of the entries are read
+        in few large reads, sorted by offset; valuedata is None for values
+        stored in the entry and for custom tags, which are read by
+        TiffTag.
+
+        """
+        fh = self.parent.filehandle
+        byteorder = self.parent.byteorder
+        offset_size = self.parent.offset_size
+        dtype = TIFF_TAG_ENTRY_DTYPES[byteorder, offset_size]
+        entryoffset = fh.tell()
+        data = fh.read(numtags * dtype.itemsize)
+        if len(data) < numtags * dtype.itemsize:
+            warnings.warn("corrupted tag list at offset %i" % entryoffset)
+            numtags = len(data) // dtype.itemsize
+        entries = numpy.frombuffer(data, dtype, numtags)
+
+        # values stored outside of entries
+        sizes = TIFF_DATA_TYPE_SIZES[entries['dtype']] * entries['count']
+        external = numpy.flatnonzero(sizes > offset_size)
+        entries = entries.tolist()
+        external = sorted(
+            (entries[i][4], size, i)
+            for i, size in zip(external.tolist(), sizes[external].tolist())
+            if entries[i][0] not in CUSTOM_TAGS and
+            4 <= entries[i][4] and entries[i][4] + size <= fh.size)
+
+        # read values in runs of nearby values
+        valuedata = [None] * numtags
+        pos = fh.tell()
+        i = 0
+        while i < len(external):
+            start = external[i][0]
+            end = start + external[i][1]
+            j = i + 1
+            while j < len(external) and external[j][0] <= end + 4096:
+                end = max(end, external[j][0] + external[j][1])
+                j += 1
+            fh.seek(start)
+            run = fh.read(end - start)
+            for valueoffset, size, index in external[i:j]:
+                valuedata[index] = run[valueoffset-start:valueoffset-start+size]
+            i = j
+        fh.seek(pos)
+
+        tagsize = dtype.itemsize
+        return [(entryoffset + i * tagsize, entries[i][:4], valuedata[i])
+                for i in range(numtags)]
+
     def _process_tags(self):
         """Validate standard tags and initialize attributes.
 
@@ -2056,22 +2596,25 @@ class TiffPage(object):
 
         """
         tags = self.tags
-        for code, (name, default, dtype, count, validate) in TIFF_TAGS.items():
-            if name in tags:
-                #tags[name] = TiffTag(code, dtype=dtype, count=count,
-                #                     value=default, name=name)
-                if validate:
-                    try:
-                        if tags[name].count == 1:
-                            setattr(self, name, validate[tags[name].value])
-                        else:
-                            setattr(self, name, tuple(
-                                validate[value] for value in tags[name].value))
-                    except KeyError:
-                        raise ValueError("%s.value (%s) not supported" %
-                                         (name, tags[name].value))
-            elif default is not None:
-                setattr(self, name, validate[default] if validate else default)
+        # set defaults, then validate the standard tags present in page
+        self.__dict__.update(TIFF_TAG_DEFAULTS)
+        for name, tag in tags.items():
+            if tag.code not in TIFF_TAGS:
+                continue
+            validate = TIFF_TAGS[tag.code][4]
+            if not validate:
+                # tag values are accessed via __getattr__
+                self.__dict__.pop(name, None)
+                continue
+            try:
+                if tag.count == 1:
+                    setattr(self, name, validate[tag.value])
+                else:
+                    setattr(self, name, tuple(
+                        validate[value] for value in tag.value))
+            except KeyError:
+                raise ValueError("%s.value (%s) not supported" %
+                                 (name, tag.value))
 
         if 'bits_per_sample' in tags:
             tag = tags['bits_per_sample']
@@ -2314,7 +2857,7 @@ class TiffPage(object):
 
     def asarray(self, squeeze=True, colormapped=True, rgbonly=False,
                 scale_mdgel=False, memmap=False, reopen=True,
-                maxsize=64*1024*1024*1024):
+                maxsize=64*1024*1024*1024, maxworkers=None):
         """Read image data from file and return as numpy array.
 
         Raise ValueError if format is unsupported.
@@ -2342,6 +2885,9 @@ class TiffPage(object):
         maxsize: int or None
             Maximum size of data before a ValueError is raised.
             Can be used to catch DOS. Default: 64 GB.
+        maxworkers : int or None
+            Maximum number of threads used to decompress strips or tiles.
+            By default one per CPU. If 1, decode in the calling thread.
 
         """
         if not self._shape:
@@ -2359,7 +2905,7 @@ class TiffPage(object):
             if tag.count != 1 and any((i-tag.value[0] for i in tag.value)):
                 raise ValueError("sample formats do not match %s" % tag.value)
 
-        if self.is_chroma_subsampled:
+        if self.is_chroma_subsampled and self.compression != 'jpeg':
             # TODO: implement chroma subsampling
             raise NotImplementedError("chroma subsampling not supported")
 
@@ -2381,6 +2927,7 @@ class TiffPage(object):
         lsb2msb = self.fill_order == 'lsb2msb'
 
         byte_counts, offsets = self._byte_counts_offsets
+        predicted = False
 
         if self.is_tiled:
             tile_width = self.tile_width
@@ -2392,63 +2939,29 @@ class TiffPage(object):
             shape = (shape[0], shape[1],
                      td*tile_depth, tl*tile_length, tw*tile_width, shape[-1])
             tile_shape = (tile_depth, tile_length, tile_width, shape[-1])
-            runlen = tile_width
-        else:
-            runlen = image_width
 
         if memmap and self._is_memmappable(rgbonly, colormapped):
             result = fh.memmap_array(typecode, shape, offset=offsets[0])
         elif self.is_contiguous:
-            fh.seek(offsets[0])
-            result = fh.read_array(typecode, product(shape))
-            result = result.astype('=' + dtype)
+            with fh.lock:
+                fh.seek(offsets[0])
+                result = fh.read_array(typecode, product(shape))
+            if not result.dtype.isnative:
+                result.byteswap(True)
+            result = result.view('=' + dtype)
             if lsb2msb:
                 reverse_bitorder(result)
         else:
-            if self.is_contig:
-                runlen *= self.samples_per_pixel
-            if bits_per_sample in (8, 16, 32, 64, 128):
-                if (bits_per_sample * runlen) % 8:
-                    raise ValueError("data and sample size mismatch")
-
-                def unpack(x, typecode=typecode):
-                    if self.predictor == 'float':
-                        # the floating point horizontal differencing decoder
-                        # needs the raw byte order
-                        typecode = dtype
-                    try:
-                        return numpy.fromstring(x, typecode)
-                    except ValueError as e:
-                        # strips may be missing EOI
-                        warnings.warn("unpack: %s" % e)
-                        xlen = ((len(x) // (bits_per_sample // 8)) *
-                                (bits_per_sample // 8))
-                        return numpy.fromstring(x[:xlen], typecode)
-
-            elif isinstance(bits_per_sample, tuple):
-                def unpack(x):
-                    return unpack_rgb(x, typecode, bits_per_sample)
-            else:
-                def unpack(x):
-                    return unpack_ints(x, typecode, bits_per_sample, runlen)
-
-            decompress = TIFF_DECOMPESSORS[self.compression]
-            if self.compression == 'jpeg':
-                table = self.jpeg_tables if 'jpeg_tables' in self.tags else b''
-
-                def decompress(x):
-                    return decode_jpeg(x, table, self.photometric)
+            decode = self._segment_decoder()
+            if not self.compression and not self.predictor:
+                maxworkers = 1  # nothing worth to parallelize
 
             if self.is_tiled:
                 result = numpy.empty(shape, dtype)
-                tw, tl, td, pl = 0, 0, 0, 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    tile = fh.read(bytecount)
-                    if lsb2msb:
-                        tile = reverse_bitorder(tile)
-                    tile = decompress(tile)
-                    tile = unpack(tile)
+
+                def decode_tile(chunk):
+                    data, (pl, td, tl, tw) = chunk
+                    tile = decode(data)
                     try:
                         tile.shape = tile_shape
                     except ValueError:
@@ -2458,49 +2971,93 @@ class TiffPage(object):
                         s = min(tile.size, t.size)
                         t[:s] = tile[:s]
                         tile = t.reshape(tile_shape)
-                    if self.predictor == 'horizontal':
-                        numpy.cumsum(tile, axis=-2, dtype=dtype, out=tile)
-                    elif self.predictor == 'float':
-                        raise NotImplementedError()
-                    result[0, pl, td:td+tile_depth,
-                           tl:tl+tile_length, tw:tw+tile_width, :] = tile
-                    del tile
-                    tw += tile_width
-                    if tw >= shape[4]:
-                        tw, tl = 0, tl + tile_length
-                        if tl >= shape[3]:
-                            tl, td = 0, td + tile_depth
-                            if td >= shape[2]:
-                                td, pl = 0, pl + 1
+                    # undo prediction into result, decoded tiles may be
+                    # read-only views of the decompressed bytes
+                    self._undo_predictor(tile, out=result[
+                        0, pl, td:td+tile_depth, tl:tl+tile_length,
+                        tw:tw+tile_width, :])
+
+                segments = []
+                for i, (offset, bytecount) in enumerate(zip(offsets,
+                                                            byte_counts)):
+                    pl, i = divmod(i, td*tl*tw)
+                    z, i = divmod(i, tl*tw)
+                    y, x = divmod(i, tw)
+                    segments.append((offset, bytecount, (
+                        pl, z*tile_depth, y*tile_length, x*tile_width)))
+                map_threaded(decode_tile, self._read_segments(segments),
+                             maxworkers)
+                predicted = True
                 result = result[...,
                                 :image_depth, :image_length, :image_width, :]
             else:
-                strip_size = (self.rows_per_strip * self.image_width *
-                              self.samples_per_pixel)
                 result = numpy.empty(shape, dtype).reshape(-1)
-                index = 0
-                for offset, bytecount in zip(offsets, byte_counts):
-                    fh.seek(offset)
-                    strip = fh.read(bytecount)
-                    if lsb2msb:
-                        strip = reverse_bitorder(strip)
-                    strip = decompress(strip)
-                    strip = unpack(strip)
-                    size = min(result.size, strip.size, strip_size,
-                               result.size - index)
-                    result[index:index+size] = strip[:size]
-                    del strip
-                    index += size
+                rows_per_strip = min(self.rows_per_strip, image_length)
+                strips_per_image = ((image_length + rows_per_strip - 1) //
+                                    rows_per_strip)
+                rowsize = image_width * shape[-1]
+                if len(offsets) == product(shape[:3]) * strips_per_image:
+                    # the position of each strip in result is known
+                    def decode_strip(chunk):
+                        data, (index, rows) = chunk
+                        size = rows * rowsize
+                        strip = decode(data)[:size]
+                        if strip.size < size:
+                            warnings.warn("incomplete strip data")
+                            t = numpy.zeros(size, strip.dtype)
+                            t[:strip.size] = strip
+                            strip = t
+                        # undo prediction into result, decoded strips may be
+                        # read-only views of the decompressed bytes
+                        strip.shape = rows, image_width, shape[-1]
+                        out = result[index:index+size]
+                        out.shape = strip.shape
+                        self._undo_predictor(strip, out=out)
+
+                    segments = []
+                    for i, (offset, bytecount) in enumerate(zip(offsets,
+                                                                byte_counts)):
+                        image, y = divmod(i, strips_per_image)
+                        y *= rows_per_strip
+                        rows = min(rows_per_strip, image_length - y)
+                        index = (image*image_length + y) * rowsize
+                        segments.append((offset, bytecount, (index, rows)))
+                    if (not self.compression and not self.predictor and
+                            not lsb2msb and bits_per_sample ==
+                            8 * result.dtype.itemsize):
+                        # read uncompressed strips directly into result
+                        itemsize = result.dtype.itemsize
+                        self._read_segments_into(
+                            [(offset, bytecount, index * itemsize,
+                              rows * rowsize * itemsize)
+                             for offset, bytecount, (index, rows)
+                             in segments], result.view('uint8'), itemsize)
+                        if not self.parent._is_native:
+                            result.byteswap(True)
+                    else:
+                        map_threaded(decode_strip,
+                                     self._read_segments(segments),
+                                     maxworkers)
+                    predicted = True
+                else:
+                    strip_size = (self.rows_per_strip * self.image_width *
+                                  self.samples_per_pixel)
+                    index = 0
+                    for offset, bytecount in zip(offsets, byte_counts):
+                        with fh.lock:
+                            fh.seek(offset)
+                            data = fh.read(bytecount)
+                        strip = decode(data)
+                        size = min(result.size, strip.size, strip_size,
+                                   result.size - index)
+                        result[index:index+size] = strip[:size]
+                        del strip
+                        index += size
 
         result.shape = self._shape
 
-        if self.predictor and not (self.is_tiled and not self.is_contiguous):
-            if self.parent.is_lsm and not self.compression:
-                pass  # work around bug in LSM510 software
-            elif self.predictor == 'horizontal':
-                numpy.cumsum(result, axis=-2, dtype=dtype, out=result)
-            elif self.predictor == 'float':
-                result = decode_floats(result)
+        if not predicted:
+            result = self._undo_predictor(result)
         if colormapped and self.is_indexed:
             if self.color_map.shape[1] >= 2**bits_per_sample:
                 # FluoView and LSM might fail here
@@ -2547,6 +3104,368 @@ class TiffPage(object):
             fh.close()
         return result
 
+    def read_region(self, top=0, left=0, length=None, width=None,
+                    planes=None, colormapped=True, maxworkers=None,
+                    reopen=True):
+        """Read rectangular region of image data from file and return array.
+
+        Only the strips or tiles intersecting the region are read from file.
+        They are decoded in a thread pool if possible.
+
+        Parameters
+        ----------
+        top, left : int
+            Index of first row and column of region.
+        length, width : int or None
+            Number of rows and columns of region. By default the region
+            extends to the bottom and right edges of the image.
+        planes : int, slice, sequence of plane indices, or None
+            Defines which planes (leading axis of STK and contiguous ImageJ
+            pages) to return. By default all planes are returned.
+        colormapped : bool
+            If True, color mapping is applied for palette-indexed images.
+        maxworkers : int or None
+            Maximum number of threads used to decode strips or tiles.
+            By default one per CPU. If 1, decode in the calling thread.
+        reopen : bool
+            If True and the parent file handle is closed, the file is
+            temporarily re-opened (and closed if no exception occurs).
+
+        The shape of the returned array is the page shape with the lengths
+        of the Y and X axes (and planes) replaced by the region's.
+
+        """
+        if not self._shape:
+            return
+        if self.dtype is None:
+            raise ValueError("data type not supported: %s%i" % (
+                self.sample_format, self.bits_per_sample))
+        if self.compression not in TIFF_DECOMPESSORS:
+            raise ValueError("cannot decompress %s" % self.compression)
+        if self.is_chroma_subsampled and self.compression != 'jpeg':
+            raise NotImplementedError("chroma subsampling not supported")
+
+        image_width = self.image_width
+        image_length = self.image_length
+        image_depth = self.image_depth
+        if length is None:
+            length = image_length - top
+        if width is None:
+            width = image_width - left
+        if (top < 0 or left < 0 or length < 1 or width < 1 or
+                top + length > image_length or left + width > image_width):
+            raise ValueError("invalid region %s" % str(
+                (top, left, length, width)))
+
+        shape = self._shape
+        indices = list(range(shape[0]))
+        if planes is None:
+            pass
+        elif isinstance(planes, int):
+            indices = [indices[planes]]
+        elif isinstance(planes, slice):
+            indices = indices[planes]
+        elif isinstance(planes, collections.Iterable):
+            indices = [indices[i] for i in planes]
+        else:
+            raise TypeError("planes must be an int, slice, or sequence")
+        if not indices:
+            raise ValueError("no planes selected")
+
+        fh = self.parent.filehandle
+        closed = fh.closed
+        if closed:
+            if reopen:
+                fh.open()
+            else:
+                raise IOError("file handle is closed")
+
+        dtype = self._dtype
+        samples = shape[1]
+        depth = shape[2]
+        contig = shape[-1]
+        result = numpy.zeros((len(indices), samples, depth, length, width,
+                              contig), dtype)
+
+        if self.is_tiled:
+            tile_width = self.tile_width
+            tile_length = self.tile_length
+            tile_depth = self.tile_depth if 'tile_depth' in self.tags else 1
+            tw = (image_width + tile_width - 1) // tile_width
+            tl = (image_length + tile_length - 1) // tile_length
+            td = (image_depth + tile_depth - 1) // tile_depth
+            offsets = self.tile_offsets
+            byte_counts = self.tile_byte_counts
+            segmented = shape[0] == 1 and len(offsets) == samples*td*tl*tw
+        else:
+            rows_per_strip = min(self.rows_per_strip, image_length)
+            strips_per_image = ((image_length + rows_per_strip - 1) //
+                                rows_per_strip)
+            offsets = self.strip_offsets
+            byte_counts = self.strip_byte_counts
+            segmented = (len(offsets) ==
+                         shape[0]*samples*depth*strips_per_image)
+
+        if self.is_contiguous:
+            # read only the rows of the region; columns are cropped after
+            # undoing the prediction, which runs along complete rows
+            offset = self.is_contiguous[0]
+            typecode = self.parent.byteorder + dtype
+            rowsize = image_width * contig
+            itemsize = numpy.dtype(typecode).itemsize
+            for i, p in enumerate(indices):
+                for s in range(samples):
+                    for z in range(depth):
+                        index = ((p*samples + s)*depth + z)*image_length + top
+                        with fh.lock:
+                            fh.seek(offset + index*rowsize*itemsize)
+                            rows = fh.read_array(typecode, length*rowsize)
+                        rows = rows.astype('=' + dtype)
+                        if self.fill_order == 'lsb2msb':
+                            reverse_bitorder(rows)
+                        rows.shape = length, image_width, contig
+                        rows = self._undo_predictor(rows)
+                        result[i, s, z] = rows[:, left:left+width]
+        elif not segmented:
+            # unusual layouts are decoded completely and cropped
+            data = self.asarray(squeeze=False, colormapped=False,
+                                reopen=False)
+            result[:] = data[indices][..., top:top+length,
+                                      left:left+width, :]
+        else:
+            # collect segments intersecting the region in file order
+            segments = []
+            if self.is_tiled:
+                tile_shape = (tile_depth, tile_length, tile_width, contig)
+                for s in range(samples):
+                    for z in range(td):
+                        for y in range(top // tile_length,
+                                       (top+length-1) // tile_length + 1):
+                            for x in range(left // tile_width,
+                                           (left+width-1) // tile_width + 1):
+                                k = ((s*td + z)*tl + y)*tw + x
+                                segments.append((k, (s, z*tile_depth,
+                                                     y*tile_length,
+                                                     x*tile_width)))
+            else:
+                for i, p in enumerate(indices):
+                    for s in range(samples):
+                        for z in range(depth):
+                            first = ((p*samples + s)*depth + z) * \
+                                strips_per_image
+                            for y in range(top // rows_per_strip,
+                                           (top+length-1) // rows_per_strip
+                                           + 1):
+                                segments.append((first + y, (
+                                    i, s, z, y*rows_per_strip)))
+            chunks = self._read_segments(
+                (offsets[k], byte_counts[k], position)
+                for k, position in segments if byte_counts[k] > 0)
+            del segments
+
+            decode = self._segment_decoder()
+
+            def decode_tile(chunk):
+                data, (s, z, y, x) = chunk
+                tile = decode(data)
+                if tile.size != product(tile_shape):
+                    warnings.warn("invalid tile data")
+                    t = numpy.zeros(product(tile_shape), tile.dtype)
+                    n = min(tile.size, t.size)
+                    t[:n] = tile[:n]
+                    tile = t
+                tile.shape = tile_shape
+                tile = self._undo_predictor(tile)
+                z1 = min(z + tile_depth, depth)
+                y0, y1 = max(y, top), min(y + tile_length, top + length)
+                x0, x1 = max(x, left), min(x + tile_width, left + width)
+                result[0, s, z:z1, y0-top:y1-top, x0-left:x1-left] = \
+                    tile[:z1-z, y0-y:y1-y, x0-x:x1-x]
+
+            def decode_strip(chunk):
+                data, (i, s, z, y) = chunk
+                rows = min(rows_per_strip, image_length - y)
+                size = rows * image_width * contig
+                strip = decode(data)[:size]
+                if strip.size < size:
+                    t = numpy.zeros(size, strip.dtype)
+                    t[:strip.size] = strip
+                    strip = t
+                strip.shape = rows, image_width, contig
+                strip = self._undo_predictor(strip)
+                y0, y1 = max(y, top), min(y + rows, top + length)
+                result[i, s, z, y0-top:y1-top] = \
+                    strip[y0-y:y1-y, left:left+width]
+
+            map_threaded(decode_tile if self.is_tiled else decode_strip,
+                         chunks, maxworkers)
+            del chunks
+
+        if colormapped and self.is_indexed:
+            if self.color_map.shape[1] >= 2**self.bits_per_sample:
+                result = apply_colormap(result[:, 0:1, :, :, :, 0:1],
+                                        self.color_map)
+
+        shape = list(self.shape)
+        shape[self.axes.index('Y')] = length
+        shape[self.axes.index('X')] = width
+        if self._shape[0] > 1:
+            if isinstance(planes, int):
+                del shape[0]
+            else:
+                shape[0] = len(indices)
+        try:
+            result.shape = shape
+        except ValueError:
+            warnings.warn("failed to reshape from %s to %s" % (
+                str(result.shape), str(tuple(shape))))
+
+        if closed:
+            fh.close()
+        return result
+
+    def _read_segments(self, segments):
+        """Return list of (bytes, position) read for segments from file.
+
+        Segments are (offset, bytecount, position) of strips or tiles.
+        They are read in file order, adjacent segments at once.
+
+        """
+        fh = self.parent.filehandle
+        segments = sorted(segments, key=lambda x: x[0])
+        chunks = []
+        i = 0
+        with fh.lock:
+            while i < len(segments):
+                start = segments[i][0]
+                end = start + segments[i][1]
+                j = i + 1
+                while (j < len(segments) and segments[j][0] == end and
+                       end - start < 2**26):
+                    end += segments[j][1]
+                    j += 1
+                fh.seek(start)
+                data = fh.read(end - start)
+                for offset, bytecount, position in segments[i:j]:
+                    offset -= start
+                    chunks.append((data[offset:offset+bytecount], position))
+                i = j
+        return chunks
+
+    def _read_segments_into(self, segments, out, itemsize=1):
+        """Read uncompressed segments from file directly into buffer.
+
+        Segments are (offset, bytecount, index, size) of strips, where index
+        and size are the position and number of bytes of the strip in out,
+        a writable 1D uint8 array. Segments adjacent in file and out are
+        read at once. Missing data and incomplete samples of itemsize bytes
+        are zeroed.
+
+        """
+        fh = self.parent.filehandle
+        segments = sorted(segments, key=lambda x: x[0])
+        i = 0
+        with fh.lock:
+            while i < len(segments):
+                offset, bytecount, index, size = segments[i]
+                bytecount = min(bytecount, size)
+                j = i + 1
+                while (j < len(segments) and bytecount == size and
+                       segments[j][0] == offset + bytecount and
+                       segments[j][2] == index + size):
+                    bytecount += min(segments[j][1], segments[j][3])
+                    size += segments[j][3]
+                    j += 1
+                fh.seek(offset)
+                count = fh.readinto(out[index:index+bytecount])
+                if count < size:
+                    warnings.warn("incomplete strip data")
+                    count -= count % itemsize
+                    out[index+count:index+size] = 0
+                i = j
+
+    def _undo_predictor(self, data, out=None):
+        """Return data with horizontal or floating point prediction undone.
+
+        Data must be an array ending with rows of samples, i.e.
+        the X and contiguous samples axes. The result is stored in out,
+        e.g. a view of the output image, if provided. Else data is
+        modified in place if possible.
+
+        """
+        if not self.predictor or (self.parent.is_lsm and
+                                  not self.compression):
+            # work around bug in LSM510 software
+            if out is None:
+                return data
+            out[:] = data
+            return out
+        if out is None:
+            # decoded segments may be read-only views of bytes
+            out = data if data.flags.writeable else None
+        if self.predictor == 'horizontal':
+            data = numpy.cumsum(data, axis=-2, dtype=data.dtype, out=out)
+        elif self.predictor == 'float':
+            data = decode_floats(data, out=out)
+        return data
+
+    def _segment_decoder(self):
+        """Return function that decodes strip or tile bytes to 1D array.
+
+        Bit order reversal, decompression, and unpacking are applied.
+        Prediction is not undone.
+
+        """
+        dtype = self._dtype
+        typecode = self.parent.byteorder + dtype
+        bits_per_sample = self.bits_per_sample
+        lsb2msb = self.fill_order == 'lsb2msb'
+
+        if self.is_tiled:
+            runlen = self.tile_width
+        else:
+            runlen = self.image_width
+        if self.is_contig:
+            runlen *= self.samples_per_pixel
+        if bits_per_sample in (8, 16, 32, 64, 128):
+            if (bits_per_sample * runlen) % 8:
+                raise ValueError("data and sample size mismatch")
+
+            def unpack(x, typecode=typecode):
+                if self.predictor == 'float':
+                    # the floating point horizontal differencing decoder
+                    # needs the raw byte order
+                    typecode = dtype
+                try:
+                    return numpy.frombuffer(x, typecode)
+                except ValueError as e:
+                    # strips may be missing EOI
+                    warnings.warn("unpack: %s" % e)
+                    xlen = ((len(x) // (bits_per_sample // 8)) *
+                            (bits_per_sample // 8))
+                    return numpy.frombuffer(x[:xlen], typecode)
+
+        elif isinstance(bits_per_sample, tuple):
+            def unpack(x):
+                return unpack_rgb(x, typecode, bits_per_sample)
+        else:
+            def unpack(x):
+                return unpack_ints(x, typecode, bits_per_sample, runlen)
+
+        decompress = TIFF_DECOMPESSORS[self.compression]
+        if self.compression == 'jpeg':
+            tables = self.jpeg_tables if 'jpeg_tables' in self.tags else b''
+
+            def decompress(x, decode=decompress):
+                return decode(x, tables)
+
+        def decode(x):
+            if lsb2msb:
+                x = reverse_bitorder(x)
+            return unpack(decompress(x))
+
+        return decode
+
     @lazyattr
     def _byte_counts_offsets(self):
         """Return simplified byte_counts and offsets."""
@@ -2861,6 +3780,21 @@ class TiffTag(object):
         else:
             self._fromdata(arg, **kwargs)
 
+    @property
+    def _state(self):
+        """Return values of all attributes, e.g. for pickling."""
+        return (self.code, self.name, self.count, self.dtype, self.value,
+                getattr(self, 'value_offset', None), self._offset,
+                self._value, self._type)
+
+    @staticmethod
+    def _fromstate(state):
+        """Return TiffTag restored from values of _state."""
+        tag = TiffTag.__new__(TiffTag)
+        (tag.code, tag.name, tag.count, tag.dtype, tag.value,
+         tag.value_offset, tag._offset, tag._value, tag._type) = state
+        return tag
+
     def _fromdata(self, code, dtype, count, value, name=None):
         """Initialize instance from arguments."""
         self.code = int(code)
@@ -2871,37 +3805,41 @@ class TiffTag(object):
         self._value = value
         self._type = dtype
 
-    def _fromfile(self, parent):
-        """Read tag structure from open file. Advance file cursor."""
+    def _fromfile(self, parent, offset=None, entry=None, valuedata=None):
+        """Read tag structure from open file.
+
+        If entry is None, the tag entry is read at the file cursor, which is
+        advanced. Else entry is the decoded (code, dtype, count, value) of
+        the tag entry at offset, and valuedata the value bytes stored outside
+        of the entry, if already read.
+
+        """
         fh = parent.filehandle
         byteorder = parent.byteorder
-        self._offset = fh.tell()
+        if entry is None:
+            self._offset = fh.tell()
+            fmt, size = {4: ('HHI4s', 12),
+                         8: ('HHQ8s', 20)}[parent.offset_size]
+            data = fh.read(size)
+            code, dtype = struct.unpack(byteorder + fmt[:2], data[:4])
+            count, value = struct.unpack(byteorder + fmt[2:], data[4:])
+        else:
+            self._offset = offset
+            code, dtype, count, value = entry
         self.value_offset = self._offset + parent.offset_size + 4
-
-        fmt, size = {4: ('HHI4s', 12), 8: ('HHQ8s', 20)}[parent.offset_size]
-        data = fh.read(size)
-        code, dtype = struct.unpack(byteorder + fmt[:2], data[:4])
-        count, value = struct.unpack(byteorder + fmt[2:], data[4:])
         self._value = value
         self._type = dtype
 
-        if code in TIFF_TAGS:
-            name, _, _, cout_, _ = TIFF_TAGS[code]
-            if cout_ and cout_ != count:
-                count = cout_
-                warnings.warn("incorrect count for tag '%s'" % name)
-        elif code in CUSTOM_TAGS:
-            name = CUSTOM_TAGS[code][0]
-        else:
-            name = str(code)
-
+        key = (code, dtype, count, byteorder)
         try:
-            dtype = TIFF_DATA_TYPES[self._type]
+            name, dtype, count, fmt, size = TiffTag._formats[key]
         except KeyError:
-            raise TiffTag.Error("unknown tag data type %i" % self._type)
+            name, dtype, count, fmt, size = TiffTag._format(*key)
+            if len(TiffTag._formats) < 4096:
+                TiffTag._formats[key] = name, dtype, count, fmt, size
+        if count != key[2]:
+            warnings.warn("incorrect count for tag '%s'" % name)
 
-        fmt = '%s%i%s' % (byteorder, count*int(dtype[0]), dtype[1])
-        size = struct.calcsize(fmt)
         if size > parent.offset_size or code in CUSTOM_TAGS:
             pos = fh.tell()
             tof = {4: 'I', 8: 'Q'}[parent.offset_size]
@@ -2910,17 +3848,25 @@ class TiffTag(object):
                 raise TiffTag.Error("corrupt file - invalid tag value offset")
             elif offset < 4:
                 raise TiffTag.Error("corrupt value offset for tag %i" % code)
-            fh.seek(offset)
-            if code in CUSTOM_TAGS:
-                readfunc = CUSTOM_TAGS[code][1]
-                value = readfunc(fh, byteorder, dtype, count)
-                if isinstance(value, dict):  # numpy.core.records.record
-                    value = Record(value)
-            elif code in TIFF_TAGS or dtype[-1] == 's':
-                value = struct.unpack(fmt, fh.read(size))
+            if valuedata is not None and len(valuedata) >= size:
+                # value was read by TiffPage._read_tag_entries
+                if code in TIFF_TAGS or dtype[-1] == 's':
+                    value = struct.unpack(fmt, valuedata[:size])
+                else:
+                    value = numpy.frombuffer(valuedata, byteorder+dtype[-1],
+                                             count).copy()
             else:
-                value = read_numpy(fh, byteorder, dtype, count)
-            fh.seek(pos)
+                fh.seek(offset)
+                if code in CUSTOM_TAGS:
+                    readfunc = CUSTOM_TAGS[code][1]
+                    value = readfunc(fh, byteorder, dtype, count)
+                    if isinstance(value, dict):  # numpy.core.records.record
+                        value = Record(value)
+                elif code in TIFF_TAGS or dtype[-1] == 's':
+                    value = struct.unpack(fmt, fh.read(size))
+                else:
+                    value = read_numpy(fh, byteorder, dtype, count)
+                fh.seek(pos)
         else:
             value = struct.unpack(fmt, value[:size])
 
@@ -2942,6 +3888,34 @@ class TiffTag(object):
         self.count = count
         self.value = value
 
+    # cache of _format results by (code, type, count, byteorder)
+    _formats = {}
+
+    @staticmethod
+    def _format(code, tifftype, count, byteorder):
+        """Return name, dtype, count, struct format, and size of tag value.
+
+        The count is corrected for standard tags with fixed count.
+
+        """
+        if code in TIFF_TAGS:
+            name, _, _, cout_, _ = TIFF_TAGS[code]
+            if cout_ and cout_ != count:
+                count = cout_
+        elif code in CUSTOM_TAGS:
+            name = CUSTOM_TAGS[code][0]
+        else:
+            name = str(code)
+
+        try:
+            dtype = TIFF_DATA_TYPES[tifftype]
+        except KeyError:
+            raise TiffTag.Error("unknown tag data type %i" % tifftype)
+
+        fmt = '%s%i%s' % (byteorder, count*int(dtype[0]), dtype[1])
+        size = struct.calcsize(fmt)
+        return name, dtype, count, fmt, size
+
     def _fix_lsm_bitspersample(self, parent):
         """Correct LSM bitspersample tag.
 
@@ -3000,7 +3974,7 @@ class TiffPageSeries(object):
         else:
             self.parent = None
 
-    def asarray(self, memmap=False):
+    def asarray(self, memmap=False, maxworkers=None):
         """Return image data from series of TIFF pages as numpy array.
 
         Parameters
@@ -3008,10 +3982,87 @@ class TiffPageSeries(object):
         memmap : bool
             If True, return an array stored in a binary file on disk
             if possible.
+        maxworkers : int or None
+            Maximum number of threads used to decode compressed pages.
+            By default one per CPU.
 
         """
         if self.parent:
-            return self.parent.asarray(series=self, memmap=memmap)
+            return self.parent.asarray(series=self, memmap=memmap,
+                                       maxworkers=maxworkers)
+
+    def iterframes(self, chunksize=None, prefetch=2):
+        """Return iterator over decoded frames of series.
+
+        Frames are the pages of the series, or the planes of a series
+        stored in a single page, e.g. contiguous ImageJ hyperstacks.
+        Frames are decoded and returned one at a time, so the series can
+        be processed in constant memory.
+
+        Parameters
+        ----------
+        chunksize : int or None
+            If None (default), return single frames. Else return arrays of
+            up to chunksize frames stacked along a new first axis.
+        prefetch : int
+            Number of chunks read and decoded ahead in background threads
+            while the current chunk is processed. If 0, chunks are read
+            in the calling thread.
+
+        The file handle must remain open while iterating.
+
+        """
+        pages = self.pages
+        if not len(pages):
+            return
+        size = 1 if chunksize is None else int(chunksize)
+        if size < 1:
+            raise ValueError("invalid chunksize %i" % size)
+
+        if len(pages) == 1 and pages[0]._shape[0] > 1:
+            # read planes of single page
+            page = pages[0]
+            count = page._shape[0]
+
+            def read(index):
+                if chunksize is None:
+                    return page.read_region(planes=index)
+                return page.read_region(planes=slice(index, index+size))
+
+            items = range(0, count, size)
+        else:
+            page0 = next(p for p in pages if p)
+            if page0.compression:
+                kwargs = dict(maxworkers=1 if prefetch else None)
+            else:
+                kwargs = {}
+
+            def read(chunk):
+                # zero out missing pages
+                frames = [page.asarray(**kwargs) if page else
+                          numpy.zeros(page0.shape, self.dtype)
+                          for page in chunk]
+                if chunksize is None:
+                    return frames[0]
+                return numpy.stack(frames)
+
+            def chunks():
+                # pages are accessed, i.e. parsed if necessary, in the
+                # calling thread
+                for i in range(0, len(pages), size):
+                    yield [pages[j] for j in range(i, min(i+size,
+                                                          len(pages)))]
+
+            items = chunks()
+
+        parents = set(p.parent for p in ((pages[0],) if isinstance(
+            pages, TiffPages) else pages) if p)
+        if prefetch < 1 or any(p.filehandle.closed for p in parents):
+            # closed files are re-opened for each page
+            prefetch = 0
+        for data in imap_threaded(read, items, maxworkers=prefetch+1,
+                                  maxqueue=prefetch+1):
+            yield data
 
     @lazyattr
     def offset(self):
@@ -3130,6 +4181,8 @@ class TiffSequence(object):
         #if not os.path.isfile(files[0]):
         #    raise ValueError("file not found")
         self.files = files
+        # layout of single page TIFF files, if files are read with TiffFile
+        self._layout = None if imread is TiffFile else False
 
         if hasattr(imread, 'asarray'):
             # redefine imread
@@ -3176,12 +4229,26 @@ class TiffSequence(object):
         """Read image data from all files and return as single numpy array.
 
         If memmap is True, return an array stored in a binary file on disk.
-        The args and kwargs parameters are passed to the imread function.
+        Files are read concurrently in a pool of at most 'maxworkers'
+        threads, by default one per CPU, directly into the result.
+        The other args and kwargs parameters are passed to the imread
+        function.
+
+        If the files are read with TiffFile and contain a single page of
+        uncompressed, contiguous data, the layout of the first file is
+        cached. Files with the same header and layout tags are read
+        without parsing their image file directory.
 
         Raise IndexError or ValueError if image shapes do not match.
 
         """
-        im = self.imread(self.files[0], *args, **kwargs)
+        maxworkers = kwargs.pop('maxworkers', None)
+        if self._layout is None and not args and not kwargs:
+            self._layout = self._read_layout(self.files[0])
+        if self._layout:
+            im = self._read_file(self.files[0], self._layout)
+        else:
+            im = self.imread(self.files[0], *args, **kwargs)
         shape = self.shape + im.shape
         if memmap:
             with tempfile.NamedTemporaryFile(dir=tempdir) as fh:
@@ -3189,14 +4256,129 @@ class TiffSequence(object):
         else:
             result = numpy.zeros(shape, dtype=im.dtype)
         result = result.reshape(-1, *im.shape)
-        for index, fname in zip(self._indices, self.files):
+
+        def read(item):
+            index, fname = item
             index = [i-j for i, j in zip(index, self._start_index)]
             index = numpy.ravel_multi_index(index, self.shape)
-            im = self.imread(fname, *args, **kwargs)
+            im = None
+            if self._layout and not args and not kwargs:
+                im = self._read_file(fname, self._layout)
+            if im is None:
+                im = self.imread(fname, *args, **kwargs)
             result[index] = im
+
+        for _ in imap_threaded(read, zip(self._indices, self.files),
+                               maxworkers):
+            pass
+        if memmap:
+            result.flush()
         result.shape = shape
         return result
 
+    # tags defining the location and format of image data in file
+    _layout_tags = frozenset((
+        254, 256, 257, 258, 259, 262, 266, 273, 277, 278, 279, 284, 317,
+        320, 322, 323, 324, 325, 338, 339, 32997, 32998))
+
+    def _read_header(self, fh):
+        """Return header and layout tag entries of first IFD in file.
+
+        Values that do not fit in the entries, e.g. the strip offsets of
+        files with several strips, are read and appended to the entries.
+        Return None if the file contains more than one page.
+
+        """
+        fh.seek(0)
+        header = fh.read(16)
+        byteorder = {b'II': '<', b'MM': '>'}.get(header[:2])
+        if byteorder is None:
+            return
+        if struct.unpack(byteorder+'H', header[2:4])[0] == 43:
+            offset_size, offset_format, tag_size = 8, 'Q', 20
+            numtags_format, offset = 'Q', struct.unpack(byteorder+'Q',
+                                                        header[8:16])[0]
+        else:
+            header = header[:8]
+            offset_size, offset_format, tag_size = 4, 'I', 12
+            numtags_format, offset = 'H', struct.unpack(byteorder+'I',
+                                                        header[4:8])[0]
+        numtags_size = struct.calcsize(numtags_format)
+        fh.seek(offset)
+        data = fh.read(numtags_size)
+        if len(data) < numtags_size:
+            return
+        numtags = struct.unpack(byteorder+numtags_format, data)[0]
+        if numtags > 4096:
+            return
+        data = fh.read(numtags*tag_size + offset_size)
+        if len(data) < numtags*tag_size + offset_size:
+            return
+        if struct.unpack(byteorder+offset_format, data[-offset_size:])[0]:
+            return  # multiple pages
+        entries = []
+        for i in range(0, numtags*tag_size, tag_size):
+            entry = data[i:i+tag_size]
+            code, dtype = struct.unpack(byteorder+'HH', entry[:4])
+            if code not in self._layout_tags:
+                continue
+            count, offset = struct.unpack(byteorder+offset_format*2,
+                                          entry[4:])
+            size = int(TIFF_DATA_TYPE_SIZES[dtype]) * count
+            if size > offset_size:
+                # the entry only contains the offset of the values
+                if size > 2**20:
+                    return
+                fh.seek(offset)
+                value = fh.read(size)
+                if len(value) < size:
+                    return
+                entry += value
+            entries.append(entry)
+        return header, tuple(entries)
+
+    def _read_layout(self, fname):
+        """Return layout of image data in TIFF file or False.
+
+        The layout is the header, the layout tag entries, and the offset,
+        typecode, and shape of the contiguous image data in file.
+
+        """
+        try:
+            with TiffFile(fname) as tif:
+                if len(tif.pages) != 1 or len(tif.series) != 1:
+                    return False
+                page = tif.pages[0]
+                if (not page.is_contiguous or page.is_indexed or
+                        page.predictor or page.fill_order != 'msb2lsb' or
+                        page.is_chroma_subsampled or
+                        tif.series[0].shape != page.shape):
+                    return False
+                header = self._read_header(tif.filehandle)
+                if header is None:
+                    return False
+                return (header, page.is_contiguous[0],
+                        tif.byteorder + numpy.dtype(page.dtype).char,
+                        page.shape)
+        except Exception:
+            return False
+
+    def _read_file(self, fname, layout):
+        """Return image data from file with cached layout, else None."""
+        header, offset, typecode, shape = layout
+        with FileHandle(fname) as fh:
+            if self._read_header(fh) != header:
+                return
+            fh.seek(offset)
+            data = fh.read_array(typecode, product(shape))
+        if data.size != product(shape):
+            return
+        if not data.dtype.isnative:
+            data.byteswap(True)
+            data = data.view(data.dtype.newbyteorder())
+        data.shape = shape
+        return data
+
     def _parse(self):
         """Get axes and shape from file names."""
         if not self.pattern:
@@ -3325,12 +4507,15 @@ class FileHandle(object):
         Size of file in bytes.
     is_file : bool
         If True, file has a filno and can be memory-mapped.
+    lock : threading.RLock
+        Lock to hold while seeking and reading when the file is shared
+        between threads.
 
     All attributes are read-only.
 
     """
     __slots__ = ('_fh', '_file', '_mode', '_name', '_dir',
-                 '_offset', '_size', '_close', 'is_file')
+                 '_offset', '_size', '_close', 'is_file', '_lock')
 
     def __init__(self, file, mode='rb', name=None, offset=None, size=None):
         """Initialize file handle from file name or another file handle.
@@ -3361,6 +4546,7 @@ class FileHandle(object):
         self._size = size
         self._close = True
         self.is_file = False
+        self._lock = threading.RLock()
         self.open()
 
     def open(self):
@@ -3440,6 +4626,19 @@ class FileHandle(object):
             size = self._size
         return self._fh.read(size)
 
+    def readinto(self, b):
+        """Read bytes into pre-allocated writable bytes-like object b.
+
+        Return number of bytes read, which is less than len(b) at EOF.
+
+        """
+        try:
+            return self._fh.readinto(b)
+        except (AttributeError, io.UnsupportedOperation):
+            data = self._fh.read(len(b))
+            b[:len(data)] = data
+            return len(data)
+
     def write(self, bytestring):
         """Write bytestring to file."""
         return self._fh.write(bytestring)
@@ -3466,12 +4665,20 @@ class FileHandle(object):
         try:
             return numpy.fromfile(self._fh, dtype, count, sep)
         except IOError:
+            dtype = numpy.dtype(dtype)
             if count < 0:
                 size = self._size
+                if not sep:
+                    size -= size % dtype.itemsize
             else:
-                size = count * numpy.dtype(dtype).itemsize
-            data = self._fh.read(size)
-            return numpy.fromstring(data, dtype, count, sep)
+                size = count * dtype.itemsize
+            if sep:
+                data = self._fh.read(size)
+                return numpy.fromstring(data, dtype, count, sep)
+            # read directly into result
+            result = numpy.empty(size // dtype.itemsize, dtype)
+            size = self.readinto(result.view('uint8'))
+            return result[:size // dtype.itemsize]
 
     def read_record(self, dtype, shape=1, byteorder=None):
         """Return numpy record from file."""
@@ -3550,6 +4757,76 @@ class FileHandle(object):
     def closed(self):
         return self._fh is None
 
+    @property
+    def lock(self):
+        return self._lock
+
+
+class FileCache(object):
+    """Keep FileHandles open, up to a limit of unused handles.
+
+    Handles are opened for use with 'open' and released with 'close'.
+    If more than 'size' handles are open, the least recently used handles,
+    which are not in use, are closed. Handles are re-opened when used again.
+
+    Attributes
+    ----------
+    size : int or None
+        Maximum number of open handles. If None, handles are not closed
+        before 'clear' is called.
+
+    """
+    __slots__ = ('size', 'lock', '_files', '_past')
+
+    def __init__(self, size=32):
+        self.size = size
+        self.lock = threading.RLock()
+        self._files = {}  # number of users of open handles
+        self._past = collections.OrderedDict()  # handles in order of use
+
+    def add(self, filehandle):
+        """Add open FileHandle to cache and close unused handles."""
+        self.open(filehandle)
+        self.close(filehandle)
+
+    def open(self, filehandle):
+        """Open FileHandle if necessary and mark it as in use."""
+        with self.lock:
+            if filehandle in self._files:
+                self._files[filehandle] += 1
+                del self._past[filehandle]
+            else:
+                if filehandle.closed:
+                    filehandle.open()
+                self._files[filehandle] = 1
+            self._past[filehandle] = None
+
+    def close(self, filehandle):
+        """Release FileHandle and close least recently used handles."""
+        with self.lock:
+            if filehandle in self._files:
+                self._files[filehandle] -= 1
+            if self.size is None:
+                return
+            unused = [fh for fh in self._past if not self._files[fh]]
+            for fh in unused[:max(len(self._past) - self.size, 0)]:
+                fh.close()
+                del self._files[fh]
+                del self._past[fh]
+
+    def clear(self):
+        """Close all unused handles and remove all handles from cache."""
+        with self.lock:
+            for fh, users in self._files.items():
+                if not users:
+                    fh.close()
+            self._files = {}
+            self._past = collections.OrderedDict()
+
+    def __len__(self):
+        """Return number of open handles in cache."""
+        return len(self._files)
+
 
 def read_bytes(fh, byteorder, dtype, count):
     """Read tag data from file and return as byte string."""
@@ -3944,7 +5221,7 @@ def imagej_metadata(data, bytecounts, byteorder):
 
     def read_bytes(data, byteorder):
         #return struct.unpack('b' * len(data), data)
-        return numpy.fromstring(data, 'uint8')
+        return numpy.frombuffer(data, 'uint8')
 
     metadata_types = {  # big endian
         b'info': ('info', read_string),
@@ -4155,18 +5432,122 @@ def _replace_by(module_function, package=__package__, warn=False):
     return decorate
 
 
-def decode_floats(data):
+def register_codec(compression, code, decode=None, encode=None):
+    """Register functions to decode and encode TIFF compression scheme.
+
+    Pages using the compression tag value can be read if a decoder is
+    registered, and TiffWriter.save(compress=compression) writes them if an
+    encoder is registered. Functions already registered for the compression
+    are replaced.
+
+    Parameters
+    ----------
+    compression : str
+        Name of the compression scheme, e.g. 'zstd'. Used as value of
+        TiffPage.compression.
+    code : int
+        Value of the TIFF compression tag. Used for writing.
+    decode : callable
+        Function returning the decoded bytes or array of an encoded strip or
+        tile. The 'jpeg' decoder is also passed the JPEG tables of the page.
+    encode : callable
+        Function returning the encoded bytes of a strip or tile, passed as
+        numpy.ndarray of shape ([depth,] length, width, samples), and of a
+        compression level, which is None if not specified.
+
+    """
+    TIFF_COMPESSIONS[code] = compression
+    if decode is not None:
+        TIFF_DECOMPESSORS[compression] = decode
+    if encode is not None:
+        TIFF_COMPRESSORS[compression] = (code, encode)
+
+
+def decode_floats(data, out=None):
     """Decode floating point horizontal differencing.
 
     The TIFF predictor type 3 reorders the bytes of the image values and
     applies horizontal byte differencing to improve compression of floating
     point images. The ordering of interleaved color channels is preserved.
 
+    Rows are decoded in small blocks, which are written to the output array
+    directly. Only a buffer for one block is allocated.
+
     Parameters
     ----------
     data : numpy.ndarray
         The image to be decoded. The dtype must be a floating point.
         The shape must include the number of contiguous samples per pixel
+        even if 1. Data may be read-only, e.g. a view of decompressed bytes.
+    out : numpy.ndarray
+        Array of the shape and dtype of data where the decoded image is
+        stored, e.g. data itself or a view of a tile in the output image.
+        By default a new array is returned.
+
+    """
+    shape = data.shape
+    dtype = data.dtype
+    if len(shape) < 3:
+        raise ValueError('invalid data shape')
+    if dtype.char not in 'dfe':
+        raise ValueError('not a floating point image')
+    if out is None:
+        out = numpy.empty(shape, dtype)
+    elif out.shape != shape or out.dtype.char != dtype.char:
+        raise ValueError('invalid output array')
+    if not out.flags.c_contiguous:
+        out[:] = decode_floats(data)
+        return out
+    littleendian = out.dtype.byteorder == '<' or (
+        sys.byteorder == 'little' and out.dtype.byteorder == '=')
+    itemsize = dtype.itemsize
+    width, samples = shape[-2:]
+    rows = numpy.ascontiguousarray(data).view('uint8')
+    rows.shape = -1, width * itemsize, samples
+    # bytes of values, most significant first
+    values = out.view('uint8').reshape(-1, width, samples, itemsize)
+    if littleendian:
+        values = values[..., ::-1]
+    count = rows.shape[0]
+    if samples == 1:
+        # the differences of single samples are summed in transposed blocks
+        # of rows, which numpy vectorizes across the rows
+        step = 16
+        buffer = numpy.empty((rows.shape[1], min(step, count), 1), 'uint8')
+        for i in range(0, count, step):
+            block = buffer[:, :min(step, count-i)]
+            block[:] = rows[i:i+step].transpose(1, 0, 2)
+            numpy.add.accumulate(block, axis=0, dtype='uint8', out=block)
+            block = block.reshape(itemsize, width, -1, 1)
+            target = values[i:i+step]
+            for j in range(itemsize):
+                target[..., j] = block[j].transpose(1, 0, 2)
+        return out
+    step = max(1, 2**18 // (width * samples * itemsize))
+    buffer = numpy.empty((min(step, count), ) + rows.shape[1:], 'uint8')
+    for i in range(0, count, step):
+        # undo horizontal byte differencing, then reorder bytes
+        block = buffer[:min(step, count-i)]
+        numpy.cumsum(rows[i:i+step], axis=1, dtype='uint8', out=block)
+        block = block.reshape(-1, itemsize, width, samples)
+        target = values[i:i+step]
+        for j in range(itemsize):
+            target[..., j] = block[:, j]
+    return out
+
+
+def encode_floats(data):
+    """Encode floating point horizontal differencing.
+
+    Inverse of decode_floats. The bytes of the image values are reordered,
+    most significant bytes first, and horizontal byte differencing is applied
+    to each row. Return the encoded rows as new uint8 array.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The image to be encoded. The dtype must be a floating point.
+        The shape must include the number of contiguous samples per pixel
         even if 1.
 
     """
@@ -4178,32 +5559,91 @@ def decode_floats(data):
         raise ValueError('not a floating point image')
     littleendian = data.dtype.byteorder == '<' or (
         sys.byteorder == 'little' and data.dtype.byteorder == '=')
-    # undo horizontal byte differencing
-    data = data.view('uint8')
-    data.shape = shape[:-2] + (-1,) + shape[-1:]
-    numpy.cumsum(data, axis=-2, dtype='uint8', out=data)
-    # reorder bytes
+    itemsize = dtype.itemsize
+    # reorder bytes, most significant first
+    values = numpy.ascontiguousarray(data).view('uint8')
+    values = values.reshape(shape + (itemsize,))
     if littleendian:
-        data.shape = shape[:-2] + (-1,) + shape[-2:]
-    data = numpy.swapaxes(data, -3, -2)
-    data = numpy.swapaxes(data, -2, -1)
-    data = data[..., ::-1]
-    # back to float
-    data = numpy.ascontiguousarray(data)
-    data = data.view(dtype)
-    data.shape = shape
-    return data
+        values = values[..., ::-1]
+    reordered = numpy.empty(shape[:-2] + (itemsize, ) + shape[-2:], 'uint8')
+    for j in range(itemsize):
+        reordered[..., j, :, :] = values[..., j]
+    reordered.shape = shape[:-2] + (-1,) + shape[-1:]
+    # horizontal byte differencing
+    result = numpy.empty_like(reordered)
+    result[..., :1, :] = reordered[..., :1, :]
+    numpy.subtract(reordered[..., 1:, :], reordered[..., :-1, :],
+                   out=result[..., 1:, :])
+    return result
 
 
-def decode_jpeg(encoded, tables=b'', photometric=None,
-                ycbcr_subsampling=None, ycbcr_positioning=None):
-    """Decode JPEG encoded byte string (using _czifile extension module)."""
-    from czifile import _czifile
-    image = _czifile.decode_jpeg(encoded, tables)
-    if photometric == 'rgb' and ycbcr_subsampling and ycbcr_positioning:
-        # TODO: convert YCbCr to RGB
-        pass
-    return image.tostring()
+def decode_jpeg(encoded, tables=b''):
+    """Decode JPEG encoded strip or tile.
+
+    Return the samples as flat uint8 array. YCbCr images are converted to RGB.
+    Uses imagecodecs if installed, else the Python Imaging Library.
+
+    Parameters
+    ----------
+    encoded : bytes
+        JPEG stream of the strip or tile. Abbreviated streams are decoded
+        with the tables of the 'jpeg_tables' tag.
+    tables : bytes
+        Value of the 'jpeg_tables' tag of the page.
+
+    """
+    if imagecodecs is not None:
+        image = imagecodecs.jpeg8_decode(encoded, tables=tables or None)
+        return image.reshape(-1)
+    from PIL import Image
+    if tables:
+        # insert the tables between the SOI markers of both streams
+        encoded = tables[:-2] + encoded[2:]
+    image = Image.open(io.BytesIO(encoded))
+    return numpy.asarray(image).reshape(-1)
+
+
+def encode_jpeg(data, level=None):
+    """Return JPEG stream of uint8 grayscale or RGB strip or tile.
+
+    RGB images are stored as YCbCr without chroma subsampling.
+    Uses the Python Imaging Library.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The image to be encoded. The last dimensions are length, width,
+        and samples (1 or 3).
+    level : int
+        JPEG quality from 1 to 95. Default: 75.
+
+    """
+    from PIL import Image
+    data = numpy.asarray(data)
+    shape = data.shape[-3:]
+    if shape[-1] == 1:
+        shape = shape[:-1]
+    result = io.BytesIO()
+    Image.fromarray(data.reshape(shape)).save(
+        result, 'JPEG', quality=75 if level is None else level, subsampling=0)
+    return result.getvalue()
+
+
+def decode_zstd(encoded):
+    """Decompress Zstandard encoded byte string (using zstandard module)."""
+    decompressor = zstandard.ZstdDecompressor()
+    try:
+        return decompressor.decompress(encoded)
+    except zstandard.ZstdError:
+        # frames written by streaming encoders may not store the content size
+        return decompressor.decompressobj().decompress(encoded)
+
+
+def encode_zstd(data, level=None):
+    """Compress byte string with Zstandard (using zstandard module)."""
+    if level is None:
+        level = 3
+    return zstandard.ZstdCompressor(level=level).compress(data)
 
 
 @_replace_by('_tifffile.decode_packbits')
@@ -4212,24 +5652,62 @@ def decode_packbits(encoded):
 
     PackBits is a simple byte-oriented run-length compression scheme.
 
+    Only the run headers are located in a Python loop. The runs are expanded
+    with numpy.repeat and the literal bytes copied using boolean masks.
+
     """
-    func = ord if sys.version[0] == '2' else lambda x: x
-    result = []
-    result_extend = result.extend
+    data = numpy.frombuffer(encoded, 'uint8')
+    size = len(data)
+    if size == 0:
+        return b''
+    if sys.version[0] == '2':
+        encoded = bytearray(encoded)
+    steps = _PACKBITS_STEPS
+    headers = []
+    headers_append = headers.append
     i = 0
-    try:
-        while True:
-            n = func(encoded[i]) + 1
-            i += 1
-            if n < 129:
-                result_extend(encoded[i:i+n])
-                i += n
-            elif n > 129:
-                result_extend(encoded[i:i+1] * (258-n))
-                i += 1
-    except IndexError:
-        pass
-    return b''.join(result) if sys.version[0] == '2' else bytes(result)
+    while i < size:
+        headers_append(i)
+        i += steps[encoded[i]]
+    headers = numpy.array(headers, 'intp')
+    header = data[headers].astype('intp')
+    literal = header < 128
+    # number of output bytes and position of first input byte of runs
+    count = numpy.where(literal, header + 1, 257 - header)
+    count[header == 128] = 0
+    start = headers + 1
+    # truncate last run at end of data
+    if start[-1] >= size:
+        count[-1] = 0
+    elif literal[-1]:
+        count[-1] = min(count[-1], size - start[-1])
+    nonzero = numpy.nonzero(count)[0]
+    start = start[nonzero]
+    count = count[nonzero]
+    literal = literal[nonzero]
+    # repeat first byte of all runs
+    result = numpy.repeat(data[start], count)
+    # copy remaining bytes of literal runs
+    literal &= count > 1
+    if literal.any():
+        outstart = (numpy.cumsum(count) - count)[literal]
+        start = start[literal]
+        count = count[literal]
+        mask = numpy.zeros(size + 1, 'int8')
+        mask[start + 1] = 1
+        mask[start + count] -= 1
+        inmask = numpy.cumsum(mask, dtype='int8').view('bool')[:size]
+        mask = numpy.zeros(len(result) + 1, 'int8')
+        mask[outstart + 1] = 1
+        mask[outstart + count] -= 1
+        outmask = numpy.cumsum(mask, dtype='int8').view('bool')[:-1]
+        result[outmask] = data[inmask]
+    return result.tobytes()
+
+
+# number of bytes from a PackBits header to the next header
+_PACKBITS_STEPS = [n + 2 if n < 128 else (1 if n == 128 else 2)
+                   for n in range(256)]
 
 
 @_replace_by('_tifffile.decode_lzw')
@@ -4241,76 +5719,63 @@ def decode_lzw(encoded):
     This is an implementation of the LZW decoding algorithm described in (1).
     It is not compatible with old style LZW compressed files like quad-lzw.tif.
 
+    The codes are extracted with numpy. The code widths only depend on the
+    number of codes since the last CLEAR code. The strings of poorly
+    compressed segments are resolved by vectorized pointer jumping, others
+    by copying from the decoded output using a table of offsets and lengths.
+
     """
     len_encoded = len(encoded)
-    bitcount_max = len_encoded * 8
-    unpack = struct.unpack
-
-    if sys.version[0] == '2':
-        newtable = [chr(i) for i in range(256)]
-    else:
-        newtable = [bytes([i]) for i in range(256)]
-    newtable.extend((0, 0))
-
-    def next_code():
-        """Return integer of 'bitw' bits at 'bitcount' position in encoded."""
-        start = bitcount // 8
-        s = encoded[start:start+4]
-        try:
-            code = unpack('>I', s)[0]
-        except Exception:
-            code = unpack('>I', s + b'\x00'*(4-len(s)))[0]
-        code <<= bitcount % 8
-        code &= mask
-        return code >> shr
-
-    switchbitch = {  # code: bit-width, shr-bits, bit-mask
-        255: (9, 23, int(9*'1'+'0'*23, 2)),
-        511: (10, 22, int(10*'1'+'0'*22, 2)),
-        1023: (11, 21, int(11*'1'+'0'*21, 2)),
-        2047: (12, 20, int(12*'1'+'0'*20, 2)), }
-    bitw, shr, mask = switchbitch[255]
-    bitcount = 0
-
     if len_encoded < 4:
         raise ValueError("strip must be at least 4 characters long")
 
-    if next_code() != 256:
-        raise ValueError("strip must begin with CLEAR code")
-
-    code = 0
-    oldcode = 0
+    segments, code = _lzw_segments(encoded)
     result = []
-    result_append = result.append
-    while True:
-        code = next_code()  # ~5% faster when inlining this function
-        bitcount += bitw
-        if code == 257 or bitcount >= bitcount_max:  # EOI
-            break
-        if code == 256:  # CLEAR
-            table = newtable[:]
-            table_append = table.append
-            lentable = 258
-            bitw, shr, mask = switchbitch[255]
-            code = next_code()
-            bitcount += bitw
-            if code == 257:  # EOI
+    for codes in segments:
+        if len(codes) == 0:
+            continue
+        index = numpy.arange(len(codes))
+        parent = codes - 258
+        literal = parent < 0
+        invalid = numpy.nonzero(parent >= index)[0]
+        if len(invalid):
+            warnings.warn("invalid lzw code %i" % codes[invalid[0]])
+            codes = codes[:invalid[0]]
+            if len(codes) == 0:
                 break
-            result_append(table[code])
-        else:
-            if code < lentable:
-                decoded = table[code]
-                newcode = table[oldcode] + decoded[:1]
-            else:
-                newcode = table[oldcode]
-                newcode += newcode[:1]
-                decoded = newcode
-            result_append(decoded)
-            table_append(newcode)
-            lentable += 1
-        oldcode = code
-        if lentable in switchbitch:
-            bitw, shr, mask = switchbitch[lentable]
+            index = index[:len(codes)]
+            parent = parent[:len(codes)]
+            literal = literal[:len(codes)]
+        # string lengths from the depth of codes in the table tree
+        parent[literal] = index[literal]
+        depth = (~literal).astype('intp')
+        up = parent
+        while True:
+            upup = up[up]
+            if (upup == up).all():
+                break
+            depth += depth[up]
+            up = upup
+        length = depth + 1
+        if len(invalid) == 0 and length.mean() > 8:
+            result.append(_decode_lzw_segment(codes.tolist()))
+            continue
+        # each byte of a string is copied from the string of its parent
+        # code or, for the last byte, from the start of the following code
+        offset = numpy.cumsum(length) - length
+        size = int(offset[-1] + length[-1])
+        codeindex = numpy.repeat(index, length)
+        src = numpy.arange(size)
+        src = numpy.where(literal[codeindex], src,
+                          src + offset[parent[codeindex]] - offset[codeindex])
+        while True:
+            src2 = src[src]
+            if (src2 == src).all():
+                break
+            src = src2
+        result.append(codes[codeindex[src]].astype('uint8').tobytes())
+        if len(invalid):
+            break
 
     if code != 257:
         warnings.warn("unexpected end of lzw stream (code %i)" % code)
@@ -4318,6 +5783,85 @@ def decode_lzw(encoded):
     return b''.join(result)
 
 
+def _lzw_segments(encoded):
+    """Return arrays of LZW codes between CLEAR codes, and last code read.
+
+    Codes ending at or beyond the end of the encoded string are ignored.
+
+    """
+    bitcount_max = len(encoded) * 8
+    data = numpy.frombuffer(bytes(encoded) + b'\x00'*8, 'uint8')
+    data = data.astype('int64')
+    words = (data[:-3] << 24) | (data[1:-2] << 16) | (data[2:-1] << 8)
+    words |= data[3:]
+    del data
+
+    # bit widths and positions of codes following a CLEAR code
+    widths = numpy.empty(4096, 'int64')
+    widths[:254] = 9
+    widths[254:766] = 10
+    widths[766:1790] = 11
+    widths[1790:] = 12
+    positions = numpy.cumsum(widths) - widths
+
+    if words[0] >> 23 != 256:
+        raise ValueError("strip must begin with CLEAR code")
+    start = 9
+    segments = []
+    while True:
+        bitcount = start + positions
+        count = numpy.searchsorted(bitcount + widths, bitcount_max)
+        bitcount = bitcount[:count]
+        codes = (words[bitcount >> 3] << (bitcount & 7)) & 0xffffffff
+        codes >>= 32 - widths[:count]
+        stop = numpy.nonzero((codes == 256) | (codes == 257))[0]
+        if len(stop) == 0:
+            segments.append(codes)
+            return segments, int(codes[-1]) if count else 256
+        stop = stop[0]
+        segments.append(codes[:stop])
+        if codes[stop] == 257:  # EOI
+            return segments, 257
+        start = int(bitcount[stop] + widths[stop])  # CLEAR
+
+
+def _decode_lzw_segment(codes):
+    """Return string of LZW codes following a CLEAR code.
+
+    The table stores offsets and lengths of the strings in the result.
+
+    """
+    offsets = [0] * 4096
+    lengths = [0] * 4096
+    result = bytearray(codes[:1])
+    oldoffset = 0
+    oldlength = 1
+    lentable = 258
+    for code in codes[1:]:
+        offset = len(result)
+        if code < 256:
+            result.append(code)
+            length = 1
+        elif code < lentable:
+            start = offsets[code]
+            length = lengths[code]
+            result += result[start:start+length]
+        else:
+            # the new string is the previous one plus its first character
+            result += result[oldoffset:oldoffset+oldlength]
+            result.append(result[oldoffset])
+            length = oldlength + 1
+        if lentable < 4096:
+            # the previous string is followed by the first character of
+            # the current one in result
+            offsets[lentable] = oldoffset
+            lengths[lentable] = oldlength + 1
+            lentable += 1
+        oldoffset = offset
+        oldlength = length
+    return bytes(result)
+
+
 @_replace_by('_tifffile.unpack_ints')
 def unpack_ints(data, dtype, itemsize, runlen=0):
     """Decompress byte string to array of integers of any bit size <= 32.
@@ -4335,7 +5879,7 @@ def unpack_ints(data, dtype, itemsize, runlen=0):
 
     """
     if itemsize == 1:  # bitarray
-        data = numpy.fromstring(data, '|B')
+        data = numpy.frombuffer(data, '|B')
         data = numpy.unpackbits(data)
         if runlen % 8:
             data = data.reshape(-1, runlen + (8 - runlen % 8))
@@ -4344,7 +5888,7 @@ def unpack_ints(data, dtype, itemsize, runlen=0):
 
     dtype = numpy.dtype(dtype)
     if itemsize in (8, 16, 32, 64):
-        return numpy.fromstring(data, dtype)
+        return numpy.frombuffer(data, dtype)
     if itemsize < 1 or itemsize > 32:
         raise ValueError("itemsize out of range: %i" % itemsize)
     if dtype.kind not in "biu":
@@ -4359,27 +5903,18 @@ def unpack_ints(data, dtype, itemsize, runlen=0):
     if skipbits:
         skipbits = 8 - skipbits
     shrbits = itembytes*8 - itemsize
-    bitmask = int(itemsize*'1'+'0'*shrbits, 2)
     dtypestr = '>' + dtype.char  # dtype always big endian?
 
-    unpack = struct.unpack
-    l = runlen * (len(data)*8 // (runlen*itemsize + skipbits))
-    result = numpy.empty((l,), dtype)
-    bitcount = 0
-    for i in range(len(result)):
-        start = bitcount // 8
-        s = data[start:start+itembytes]
-        try:
-            code = unpack(dtypestr, s)[0]
-        except Exception:
-            code = unpack(dtypestr, s + b'\x00'*(itembytes-len(s)))[0]
-        code <<= bitcount % 8
-        code &= bitmask
-        result[i] = code >> shrbits
-        bitcount += itemsize
-        if (i+1) % runlen == 0:
-            bitcount += skipbits
-    return result
+    # extract bits of complete rows, pad items to itembytes, and pack
+    rowbits = runlen*itemsize + skipbits
+    rows = len(data)*8 // rowbits
+    bits = numpy.unpackbits(numpy.frombuffer(data, '|B')[:rows*rowbits//8])
+    bits = bits.reshape(rows, rowbits)[:, :runlen*itemsize]
+    items = numpy.zeros((rows*runlen, itembytes*8), 'uint8')
+    items[:, shrbits:] = bits.reshape(-1, itemsize)
+    del bits
+    items = numpy.packbits(items, axis=-1)
+    return items.view(dtypestr).reshape(-1).astype(dtype)
 
 
 def unpack_rgb(data, dtype='<B', bitspersample=(5, 6, 5), rescale=True):
@@ -4420,7 +5955,7 @@ def unpack_rgb(data, dtype='<B', bitspersample=(5, 6, 5), rescale=True):
     if not (bits <= 32 and all(i <= dtype.itemsize*8 for i in bitspersample)):
         raise ValueError("sample size not supported %s" % str(bitspersample))
     dt = next(i for i in 'BHI' if numpy.dtype(i).itemsize*8 >= bits)
-    data = numpy.fromstring(data, dtype.byteorder+dt)
+    data = numpy.frombuffer(data, dtype.byteorder+dt)
     result = numpy.empty((data.size, len(bitspersample)), dtype.char)
     for i, bps in enumerate(bitspersample):
         t = data >> int(numpy.sum(bitspersample[i+1:]))
@@ -4446,7 +5981,8 @@ def reverse_bitorder(data):
     ----------
     data : byte string or ndarray
         The data to be bit reversed. If byte string, a new bit-reversed byte
-        string is returned. Numpy arrays are bit-reversed in-place.
+        string is returned. Numpy arrays are bit-reversed in-place using a
+        256-entry lookup table.
 
     Examples
     --------
@@ -4474,11 +6010,14 @@ def reverse_bitorder(data):
         b'\xef\x1f\x9f_\xdf?\xbf\x7f\xff')
     try:
         view = data.view('uint8')
-        numpy.take(numpy.fromstring(table, dtype='uint8'), view, out=view)
+        numpy.take(numpy.frombuffer(table, dtype='uint8'), view, out=view)
     except AttributeError:
         return data.translate(table)
     except ValueError:
-        raise NotImplementedError("slices of arrays not supported")
+        # slices of arrays cannot be viewed as bytes
+        copy = numpy.ascontiguousarray(data)
+        reverse_bitorder(copy)
+        data[...] = copy
 
 
 def apply_colormap(image, colormap, contig=True):
@@ -4649,16 +6188,22 @@ def stack_pages(pages, memmap=False, tempdir=None, *args, **kwargs):
     """Read data from sequence of TiffPage and stack them vertically.
 
     If memmap is True, return an array stored in a binary file on disk.
+    Compressed pages of the same file are decoded concurrently in a pool
+    of at most 'maxworkers' threads, by default one per CPU. Reading from
+    the file is serialized, decoding runs in parallel. Memory-mapped data
+    is flushed to disk in batches.
     Additional parameters are passsed to the page asarray function.
 
     """
+    maxworkers = kwargs.pop('maxworkers', None)
     if len(pages) == 0:
         raise ValueError("no pages")
 
     if len(pages) == 1:
         return pages[0].asarray(memmap=memmap, *args, **kwargs)
 
-    data0 = pages[0].asarray(*args, **kwargs)
+    page0 = pages[0]
+    data0 = page0.asarray(*args, **kwargs)
     shape = (len(pages),) + data0.shape
     if memmap:
         with tempfile.NamedTemporaryFile(dir=tempdir) as fh:
@@ -4667,17 +6212,84 @@ def stack_pages(pages, memmap=False, tempdir=None, *args, **kwargs):
         data = numpy.empty(shape, dtype=data0.dtype)
 
     data[0] = data0
-    if memmap:
-        data.flush()
     del data0
-    for i, page in enumerate(pages[1:]):
-        data[i+1] = page.asarray(*args, **kwargs)
-        if memmap:
+    # flush memory-mapped data about every 256 MB
+    flushpages = max(2**28 // max(data[0].nbytes, 1), 1)
+
+    if maxworkers is None:
+        maxworkers = multiprocessing.cpu_count()
+    if not page0.compression:
+        maxworkers = 1  # nothing worth to parallelize
+    if maxworkers > 1:
+        # pages of other files or closed files are read serially
+        if page0.parent.filehandle.closed or any(
+                page.parent is not page0.parent for page in pages[1:]):
+            maxworkers = 1
+        else:
+            # decode strips or tiles of a page in the page's thread
+            kwargs['maxworkers'] = 1
+
+    def decode(item):
+        index, page = item
+        data[index] = page.asarray(*args, **kwargs)
+
+    # pages are accessed, i.e. parsed if necessary, in this thread
+    items = ((i+1, page) for i, page in enumerate(pages[1:]))
+    for i, _ in enumerate(imap_threaded(decode, items, maxworkers)):
+        if memmap and not (i+2) % flushpages:
             data.flush()
+    if memmap:
+        data.flush()
 
     return data
 
 
+def map_threaded(func, iterable, maxworkers=None):
+    """Return list of func applied to items of iterable.
+
+    The items are processed in a pool of at most maxworkers threads if
+    concurrent.futures is available. By default one thread per CPU is used.
+    Useful for functions releasing the GIL, e.g. zlib decompression.
+
+    """
+    items = list(iterable)
+    if maxworkers is None:
+        maxworkers = multiprocessing.cpu_count()
+    maxworkers = min(maxworkers, len(items))
+    if ThreadPoolExecutor is None or maxworkers < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(maxworkers) as executor:
+        return list(executor.map(func, items))
+
+
+def imap_threaded(func, iterable, maxworkers=None, maxqueue=None):
+    """Return iterator over func applied to items of iterable.
+
+    Like map_threaded, but the items are consumed lazily and results are
+    returned in order as they become available. At most maxqueue items,
+    by default two per thread, are submitted to the pool and not yet
+    returned at any time, which bounds the memory used by a producer
+    that is faster than the consumer.
+
+    """
+    if maxworkers is None:
+        maxworkers = multiprocessing.cpu_count()
+    if ThreadPoolExecutor is None or maxworkers < 2:
+        for item in iterable:
+            yield func(item)
+        return
+    if maxqueue is None:
+        maxqueue = 2 * maxworkers
+    pending = collections.deque()
+    with ThreadPoolExecutor(maxworkers) as executor:
+        for item in iterable:
+            if len(pending) >= maxqueue:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+
+
 def stripnull(string, null=b'\x00'):
     """Return string truncated at first null character.
 
@@ -4963,6 +6575,10 @@ TIFF_COMPESSIONS = {
     34712: 'jp2000',
     34713: 'nef',
     34925: 'lzma',
+    34926: 'zstd',
+    50000: 'zstd',
+    50001: 'webp',
+    22610: 'jpegxr',
 }
 
 TIFF_DECOMPESSORS = {
@@ -4971,11 +6587,27 @@ TIFF_DECOMPESSORS = {
     'deflate': zlib.decompress,
     'packbits': decode_packbits,
     'lzw': decode_lzw,
-    # 'jpeg': decode_jpeg
+    'jpeg': decode_jpeg,
+}
+
+# compression name: (compression tag value, encode(data, level))
+TIFF_COMPRESSORS = {
+    'deflate': (32946, lambda x, level: zlib.compress(
+        x, 6 if level is None else level)),
+    'jpeg': (7, encode_jpeg),
 }
 
 if lzma:
     TIFF_DECOMPESSORS['lzma'] = lzma.decompress
+    TIFF_COMPRESSORS['lzma'] = (34925, lambda x, level: lzma.compress(
+        x, preset=level))
+
+if imagecodecs is not None:
+    TIFF_DECOMPESSORS['lzw'] = imagecodecs.lzw_decode
+    register_codec('zstd', 50000, imagecodecs.zstd_decode,
+                   imagecodecs.zstd_encode)
+elif zstandard is not None:
+    register_codec('zstd', 50000, decode_zstd, encode_zstd)
 
 TIFF_DATA_TYPES = {
     1: '1B',   # BYTE 8-bit unsigned integer.
@@ -5002,6 +6634,27 @@ TIFF_DATA_TYPES = {
     18: '1Q',  # IFD8 unsigned 8 byte IFD offset (BigTiff)
 }
 
+# version of the format of page index cache files
+TIFF_INDEX_VERSION = 1
+
+# size in bytes of TIFF data types by type code; 0 if unknown
+TIFF_DATA_TYPE_SIZES = numpy.zeros(2**16, dtype=numpy.uint64)
+for _code, _dtype in TIFF_DATA_TYPES.items():
+    TIFF_DATA_TYPE_SIZES[_code] = int(_dtype[0]) * struct.calcsize(_dtype[1])
+del _code, _dtype
+
+# IFD entries of classic and BigTIFF files by byteorder and offset size
+# the value field is also read as offset to values outside of the entry
+TIFF_TAG_ENTRY_DTYPES = dict(
+    ((byteorder, offset_size), numpy.dtype({
+        'names': ['code', 'dtype', 'count', 'value', 'offset'],
+        'formats': [byteorder+'u2', byteorder+'u2',
+                    byteorder+'u%i' % offset_size, 'V%i' % offset_size,
+                    byteorder+'u%i' % offset_size],
+        'offsets': [0, 2, 4, 4+offset_size, 4+offset_size],
+        'itemsize': 4+2*offset_size}))
+    for byteorder in '<>' for offset_size in (4, 8))
+
 TIFF_SAMPLE_FORMATS = {
     1: 'uint',
     2: 'int',
@@ -5814,6 +7467,12 @@ TIFF_TAGS = {
     # code: (attribute name, default value, type, count, validator)
 }
 
+# attribute values of TiffPage for standard tags missing in page
+TIFF_TAG_DEFAULTS = dict(
+    (name, validate[default] if validate else default)
+    for name, default, dtype, count, validate in TIFF_TAGS.values()
+    if default is not None)
+
 # Map custom TIFF tag codes to attribute names and import functions
 CUSTOM_TAGS = {
     700: ('xmp', read_bytes),